@@ -0,0 +1,272 @@
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+from termcolor import colored
+
+from benchmark.scripts.synthetic import make_synthetic_fits
+from poster.scripts.imaging import ImagingLofar
+from video.scripts.moviemaker import MovieMaker
+from video.scripts.paths import ScanPaths
+
+__all__ = ["Benchmark", "MemorySampler", "compare"]
+
+
+class MemorySampler:
+    """
+    MemorySampler follows the resident memory (RSS) of the process in a background thread, to find the peak of a
+    benchmark. This also counts memory of C libraries and memory maps, and it does not slow the benchmark down.
+    Only works on Linux (it reads /proc/self/statm), otherwise the peak is None.
+    """
+
+    def __init__(self, interval: float = 0.005):
+        """
+        :param interval: time between samples in seconds
+        """
+        self.interval = interval
+        self.start_rss = self.peak_rss = self.rss()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.sample, daemon=True)
+
+    @staticmethod
+    def rss():
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError):
+            return None
+
+    def sample(self):
+        while not self.stopped.wait(self.interval):
+            self.peak_rss = max(self.peak_rss, self.rss())
+
+    def __enter__(self):
+        if self.start_rss is not None:
+            self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stopped.set()
+        if self.start_rss is not None:
+            self.thread.join()
+            self.peak_rss = max(self.peak_rss, self.rss())
+
+    @property
+    def peak(self):
+        """Peak memory above the memory at the start, in bytes."""
+        return None if self.start_rss is None else self.peak_rss - self.start_rss
+
+
+class Benchmark:
+    """
+    Benchmark times the hot paths of the imaging and the movie making on a synthetic fits image.
+    The results (time, throughput and peak memory) are saved as JSON, so runs on different commits can be compared.
+    """
+
+    def __init__(
+        self,
+        size: int = 2000,
+        frames: int = 20,
+        cutouts: int = 50,
+        engine: str = "matplotlib",
+        process: str = None,
+        workers: int = None,
+        directory: str = None,
+    ):
+        """
+        :param size: size of the synthetic image in pixels
+        :param frames: number of frames of the zoom and move segments
+        :param cutouts: number of cutouts
+        :param engine: render engine of the movie [matplotlib, numpy, agg]
+        :param process: process of the movie [multiprocess, multithread, None]
+        :param workers: number of threads or processes (default: all cpu's)
+        :param directory: working directory for the fits file and the frames (default: a temporary directory)
+        """
+        self.size = size
+        self.frames = frames
+        self.cutouts = cutouts
+        self.engine = engine
+        self.process = process
+        self.workers = workers
+        self.directory = directory or tempfile.mkdtemp(prefix="benchmark_")
+        os.makedirs(self.directory, exist_ok=True)
+        self.fits_file = f"{self.directory}/synthetic_mosaic_{size}.fits"
+        self.results = []
+
+    def measure(self, name, function, pixels: int = None, frames: int = None):
+        """
+        Time a function and measure its peak memory (increase of the resident memory).
+        ------------------------------------------------------------
+        :param name: benchmark name
+        :param function: function without arguments
+        :param pixels: number of pixels that the function processes (for Mpix/s)
+        :param frames: number of frames that the function makes (for frames/s)
+        :return: the output of the function
+        """
+        with MemorySampler() as memory:
+            start = time.perf_counter()
+            output = function()
+            seconds = time.perf_counter() - start
+        peak = None if memory.peak is None else round(memory.peak / 1e6, 1)
+        result = dict(name=name, seconds=round(seconds, 4), peak_memory_mb=peak)
+        if pixels:
+            result["mpix_per_s"] = round(pixels / 1e6 / seconds, 2)
+        if frames:
+            result["frames_per_s"] = round(frames / seconds, 2)
+        self.results.append(result)
+        print(
+            colored(name.ljust(24), "green"),
+            f"{seconds:8.3f} s",
+            *[
+                f"{result[key]:8.2f} {key.split('_per_')[0]}/s"
+                for key in ("mpix_per_s", "frames_per_s")
+                if key in result
+            ],
+            f"{peak:8.1f} MB" if peak is not None else "",
+        )
+        return output
+
+    def run(self):
+        """
+        Run all benchmarks.
+        """
+        pixels = self.size**2
+        if not os.path.isfile(self.fits_file):
+            self.measure("synthetic fits", lambda: make_synthetic_fits(self.fits_file, size=self.size), pixels=pixels)
+
+        image = self.measure(
+            "preprocessing",
+            lambda: ImagingLofar(
+                self.fits_file, image_directory=self.directory, verbose=False, zoom_effect=False, workers=self.workers
+            ),
+            pixels=pixels,
+        )
+        raw_data = image.hdu.data[0, 0]
+        self.measure("tonemap", lambda: image.tonemap(raw_data, b=0.25, threshold=image.vmin / 100), pixels=pixels)
+
+        rng = np.random.default_rng(0)
+        cutout_size = (self.size // 4, self.size // 4)
+        positions = rng.uniform(0, self.size, (self.cutouts, 2)).astype(int)
+        self.measure(
+            "make_cutout",
+            lambda: [image.make_cutout(tuple(pos), cutout_size) for pos in positions],
+            pixels=self.cutouts * cutout_size[0] * cutout_size[1],
+        )
+        cutout, wcs = image.make_cutout((self.size // 2, self.size // 2), cutout_size)
+        self.measure(
+            "imaging",
+            lambda: image.imaging(image_data=cutout, wcs=wcs, image_name="benchmark.png", dpi=100, imsize=0.4),
+            frames=1,
+        )
+
+        ra, dec = image.wcs.wcs.crval[:2]
+        movie = self.measure(
+            "movie preprocessing",
+            lambda: MovieMaker(
+                fits_file=self.fits_file,
+                imsize=0.4,
+                framerate=self.frames,
+                process=self.process,
+                engine=self.engine,
+                workers=self.workers,
+                output_file=f"{self.directory}/frames",
+            ),
+            pixels=pixels,
+        )
+        self.measure("zoom", lambda: movie.zoom(N_frames=self.frames, first_time=True), frames=self.frames)
+        self.measure(
+            "move_to",
+            lambda: movie.move_to(N_frames=self.frames, ra=ra + 0.2, dec=dec + 0.1),
+            frames=self.frames,
+        )
+        path = ScanPaths(movie_obj=movie, zoom_size=0.4, deg_per_sec=0.1)
+        self.measure("horizontal scan path", path.horizontal_scan)
+        self.measure("spiral scan path", path.spiral_scan)
+        return self
+
+    def save(self, filename: str = "benchmark.json"):
+        """
+        Save the results with the parameters and the environment of the run.
+        ------------------------------------------------------------
+        :param filename: output JSON file
+        """
+        try:
+            commit = subprocess.run(
+                ["git", "rev-parse", "--short", "HEAD"],
+                capture_output=True,
+                text=True,
+                check=True,
+                cwd=os.path.dirname(os.path.abspath(__file__)),
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            commit = None
+        with open(filename, "w") as f:
+            json.dump(
+                dict(
+                    date=datetime.now().isoformat(timespec="seconds"),
+                    commit=commit,
+                    python=platform.python_version(),
+                    numpy=np.__version__,
+                    platform=platform.platform(),
+                    cpus=os.cpu_count(),
+                    parameters=dict(
+                        size=self.size,
+                        frames=self.frames,
+                        cutouts=self.cutouts,
+                        engine=self.engine,
+                        process=self.process,
+                        workers=self.workers,
+                    ),
+                    max_rss_mb=round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3, 1),
+                    results=self.results,
+                ),
+                f,
+                indent=2,
+            )
+        print(f"Saved benchmark results in '{filename}'")
+        return self
+
+    def clean(self):
+        """
+        Remove the working directory.
+        """
+        shutil.rmtree(self.directory, ignore_errors=True)
+        return self
+
+
+def compare(old_file, new_file):
+    """
+    Print the speedup of each benchmark between two runs.
+    ------------------------------------------------------------
+    :param old_file: JSON results of the old run
+    :param new_file: JSON results of the new run
+    """
+    with open(old_file) as f:
+        old = json.load(f)
+    with open(new_file) as f:
+        new = json.load(f)
+    print(f"Comparing {old.get('commit')} ({old_file}) with {new.get('commit')} ({new_file})")
+    old_results = {result["name"]: result for result in old["results"]}
+    for result in new["results"]:
+        if result["name"] not in old_results:
+            continue
+        old_result = old_results[result["name"]]
+        speedup = old_result["seconds"] / max(result["seconds"], 1e-9)
+        print(
+            colored(result["name"].ljust(24), "green"),
+            f"{old_result['seconds']:8.3f} s -> {result['seconds']:8.3f} s",
+            colored(f"{speedup:6.2f}x", "green" if speedup >= 1 else "red"),
+            f"{old_result['peak_memory_mb']} MB -> {result['peak_memory_mb']} MB",
+        )
+
+
+if __name__ == "__main__":
+    print("Cannot call script directly.")
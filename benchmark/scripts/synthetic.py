@@ -0,0 +1,77 @@
+import numpy as np
+from astropy.io import fits
+from astropy.wcs import WCS
+
+__all__ = ["make_synthetic_fits"]
+
+
+def make_synthetic_fits(
+    filename: str = "synthetic_mosaic.fits",
+    size: int = 2000,
+    n_sources: int = None,
+    noise: float = 1e-4,
+    pixel_size: float = 1.5,
+    ra: float = 161.75,
+    dec: float = 58.08,
+    blank: bool = True,
+    seed: int = 0,
+):
+    """
+    Make a synthetic radio image with a LOFAR-like header, so the benchmarks run without real data.
+    The image has gaussian noise, point sources and extended gaussian sources, and NaN-blanked borders
+    like a mosaic. The data has 4 axes (RA, DEC, FREQ, STOKES), as the LOFAR images.
+    ------------------------------------------------------------
+    :param filename: output fits file
+    :param size: image size in pixels (square)
+    :param n_sources: number of sources (default: one per 20000 pixels)
+    :param noise: noise level in Jy/beam
+    :param pixel_size: pixel size in arcsec
+    :param ra: right ascension of the center (degrees)
+    :param dec: declination of the center (degrees)
+    :param blank: blank the borders (outside a circle, as a mosaic) with NaN
+    :param seed: random seed
+    :return: filename
+    """
+    rng = np.random.default_rng(seed)
+    if n_sources is None:
+        n_sources = max(size**2 // 20000, 1)
+    data = rng.normal(0, noise, (size, size)).astype(np.float32)
+
+    # sources are added in stamps, so this is fast for large images
+    for _ in range(n_sources):
+        x, y = rng.uniform(0, size, 2)
+        if rng.uniform() < 0.8:  # point source at the resolution (6 arcsec beam)
+            sigma = 6 / pixel_size / 2.355
+            flux = noise * 10 ** rng.uniform(0.7, 3)
+        else:  # extended source
+            sigma = rng.uniform(3, 40)
+            flux = noise * 10 ** rng.uniform(0.5, 1.5)
+        radius = int(5 * sigma) + 1
+        x_min, x_max = max(int(x) - radius, 0), min(int(x) + radius + 1, size)
+        y_min, y_max = max(int(y) - radius, 0), min(int(y) + radius + 1, size)
+        yy, xx = np.ogrid[y_min:y_max, x_min:x_max]
+        data[y_min:y_max, x_min:x_max] += flux * np.exp(-((xx - x) ** 2 + (yy - y) ** 2) / (2 * sigma**2))
+
+    if blank:
+        yy, xx = np.ogrid[:size, :size]
+        data[(xx - size / 2) ** 2 + (yy - size / 2) ** 2 > (0.48 * size) ** 2] = np.nan
+
+    wcs = WCS(naxis=4)
+    wcs.wcs.ctype = ["RA---SIN", "DEC--SIN", "FREQ", "STOKES"]
+    wcs.wcs.cunit = ["deg", "deg", "Hz", ""]
+    wcs.wcs.crval = [ra, dec, 1.44e8, 1]
+    wcs.wcs.crpix = [size / 2, size / 2, 1, 1]
+    wcs.wcs.cdelt = [-pixel_size / 3600, pixel_size / 3600, 4.8e7, 1]
+    header = wcs.to_header()
+    header["BUNIT"] = "JY/BEAM"
+    header["BMAJ"] = 6 / 3600
+    header["BMIN"] = 6 / 3600
+    header["BPA"] = 90.0
+    header["TELESCOP"] = "LOFAR"
+    header["OBJECT"] = "Synthetic"
+    fits.PrimaryHDU(data[np.newaxis, np.newaxis], header=header).writeto(filename, overwrite=True)
+    return filename
+
+
+if __name__ == "__main__":
+    print("Cannot call script directly.")
@@ -1,36 +1,203 @@
+import os
+from multiprocessing.dummy import Pool as ThreadPool
+
+from bokeh.models import FuncTickFormatter, TMSTileSource
 from bokeh.plotting import figure, show, output_file
 
+from interactive_plot.scripts.server import TileCache, TileServer
+from interactive_plot.scripts.tiles import TILE_SIZE, max_zoom, save_tile, tile_data, tile_grid, use_tile_directory
+from poster.scripts.colormap import ColormapLUT
 from poster.scripts.imaging import ImagingLofar
 
 
 class Interactive(ImagingLofar):
-    def __init__(self, fits_file: str = None, fits_download: bool = False):
+    def __init__(
+        self,
+        fits_file: str = None,
+        fits_download: bool = False,
+        memmap: bool = False,
+        workers: int = None,
+        tile_size: int = TILE_SIZE,
+    ):
+        """
+        Interactive plot of a fits image, which is shown in the browser as a pyramid of tiles.
+        ------------------------------------------------------------
+        :param fits_file: Fits file name and path
+        :param fits_download: Boolean for downloading or not
+        :param memmap: keep the image on disk, for images larger than memory
+        :param workers: number of threads for preprocessing the image and rendering the tiles (default: all cpu's)
+        :param tile_size: tile size in pixels
+        """
         super().__init__(
             fits_file=fits_file,
             image_directory="interactive_plot/images",
             verbose=False,
             fits_download=fits_download,
             interactive=True,
+            memmap=memmap,
+            workers=workers,
+        )
+        self.tile_size = tile_size
+        self.max_zoom = max_zoom(self.image_data.shape, self.tile_size)
+        # pyramid down to the zoom level where the whole image fits in one tile
+        self.build_pyramid(min_size=max(min(self.image_data.shape) >> self.max_zoom, 1))
+        # one norm for all tiles, so the colours of neighbouring tiles and zoom levels are the same
+        _, self.norm = self.prepare_frame(image_data=self.pyramid[-1])
+        self.tile_directory = f"{self.image_directory}/tiles"
+
+    def render_tile(self, zoom: int = 0, x: int = 0, y: int = 0, cmap: str = "CMRmap"):
+        """
+        Render one tile from the preprocessed image, with the same colours as imaging().
+        ------------------------------------------------------------
+        :param zoom: zoom level (0 is the whole image in one tile)
+        :param x: tile column (from the left)
+        :param y: tile row (from the bottom)
+        :param cmap: cmap of your image
+        :return: RGB image as uint8 array with shape (tile_size, tile_size, 3)
+        """
+        with self.timer.stage("cutout"):
+            data = tile_data(self.pyramid, self.max_zoom - zoom, x, y, self.tile_size)
+        with self.timer.stage("draw"):
+            return ColormapLUT.get(cmap)(self.norm(data[::-1]))  # png rows go from the top
+
+    def tile_file(self, zoom: int = 0, x: int = 0, y: int = 0):
+        """
+        File name of a tile, as {zoom}/{x}/{y}.png in the tile directory.
+        """
+        return f"{self.tile_directory}/{zoom}/{x}/{y}.png"
+
+    def has_tile(self, zoom: int = 0, x: int = 0, y: int = 0):
+        """
+        Check if a tile covers a part of the image.
+        """
+        span = self.tile_size * 2 ** (self.max_zoom - zoom)  # full resolution pixels per tile
+        height, width = self.image_data.shape
+        return 0 <= zoom <= self.max_zoom and 0 <= x < -(-width // span) and 0 <= y < -(-height // span)
+
+    def tile_info(self, cmap: str = "CMRmap"):
+        """
+        Everything that determines the tiles, so old tiles of another image are not used.
+        ------------------------------------------------------------
+        :param cmap: cmap of your image
+        :return: dictionary
+        """
+        fits_file = os.path.abspath(self.fits_file) if self.fits_file else None
+        return dict(
+            fits_file=fits_file,
+            modified=os.path.getmtime(fits_file) if fits_file else None,
+            shape=list(self.image_data.shape),
+            tile_size=self.tile_size,
+            cmap=cmap,
+            vmin=float(self.vmin),
+            vmax=float(self.vmax),
         )
 
-    def html_from_png(self):
-        output_file("interactive.html")
-        x_low, y_low = list(float(i) for i in self.wcs.array_index_to_world_values(0, 0))
-        x_high, y_high = list(
-            float(i) for i in self.wcs.array_index_to_world_values(self.image_data.shape[0], self.image_data.shape[1])
+    def make_tiles(self, cmap: str = "CMRmap"):
+        """
+        Render the tiles of all zoom levels in a thread pool.
+        ------------------------------------------------------------
+        :param cmap: cmap of your image
+        """
+        use_tile_directory(self.tile_directory, self.tile_info(cmap))
+
+        def make_tile(tile):
+            zoom, x, y = tile
+            with self.timer.stage("save"):
+                save_tile(self.tile_file(zoom, x, y), self.render_tile(zoom, x, y, cmap))
+
+        tiles = [
+            (zoom, x, y)
+            for zoom in range(self.max_zoom + 1)
+            for x, y in tile_grid(self.image_data.shape, zoom, self.max_zoom, self.tile_size)
+        ]
+        with ThreadPool(self.workers) as p:
+            p.map(make_tile, tiles, chunksize=1)
+        print(f"Made {len(tiles)} tiles with {self.max_zoom + 1} zoom levels in '{self.tile_directory}'")
+        return self
+
+    def serve(
+        self,
+        host: str = "localhost",
+        port: int = 8000,
+        cmap: str = "CMRmap",
+        memory_size: float = 256,
+        disk_size: float = 10,
+        html_file: str = "interactive.html",
+    ):
+        """
+        Serve the tiles with a local HTTP server, instead of rendering all tiles first.
+        Tiles are rendered on the first request and kept in memory and in the tile directory (so tiles of make_tiles
+        are used too), the page from html_from_png loads the tiles from the server. Stop the server with Ctrl-C.
+        ------------------------------------------------------------
+        :param host: host name of the server
+        :param port: port of the server
+        :param cmap: cmap of your image
+        :param memory_size: maximum size of the tiles in memory in MB
+        :param disk_size: maximum size of the tiles on disk in GB
+        :param html_file: output html file
+        """
+        use_tile_directory(self.tile_directory, self.tile_info(cmap))
+
+        def render(zoom, x, y):
+            return self.render_tile(zoom, x, y, cmap) if self.has_tile(zoom, x, y) else None
+
+        server = TileServer(
+            render,
+            cache=TileCache(self.tile_directory, memory_size=memory_size, disk_size=disk_size),
+            address=(host, port),
+            workers=self.workers,
         )
-        print(x_low, y_low)
-        print(x_high, y_high)
+        print(f"Serving the tiles on http://{host}:{port}, press Ctrl-C to stop")
+        self.html_from_png(tile_url=f"http://{host}:{port}/{{Z}}/{{X}}/{{Y}}.png", html_file=html_file)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+        return self
+
+    def html_from_png(self, tile_url: str = None, html_file: str = "interactive.html"):
+        """
+        Make the interactive plot: a Bokeh page that only loads the tiles in view.
+        The plot is in pixels of the full resolution image, the axes show RA and DEC.
+        ------------------------------------------------------------
+        :param tile_url: url of the tiles with {Z}, {X} and {Y} (default: the tile directory, relative to the page)
+        :param html_file: output html file
+        """
+        if tile_url is None:
+            tile_url = os.path.relpath(self.tile_directory, os.path.dirname(os.path.abspath(html_file)))
+            tile_url += "/{Z}/{X}/{Y}.png"
+        output_file(html_file)
+        height, width = self.image_data.shape
+        x_low, y_low = (float(i) for i in self.wcs.pixel_to_world_values(0, 0))
+        x_high, y_high = (float(i) for i in self.wcs.pixel_to_world_values(width, height))
         p = figure(
-            x_range=(x_low, x_high),
-            y_range=(y_low, y_high),
-            tools="hover,pan,wheel_zoom",
+            x_range=(0, width),
+            y_range=(0, height),
+            tools="pan,wheel_zoom,reset",
             active_scroll="wheel_zoom",
             active_drag="pan",
+            match_aspect=True,
+        )
+        p.add_tile(
+            TMSTileSource(
+                url=tile_url,
+                tile_size=self.tile_size,
+                min_zoom=0,
+                max_zoom=self.max_zoom,
+                initial_resolution=2**self.max_zoom,  # image pixels per tile pixel at zoom 0
+                x_origin_offset=0,
+                y_origin_offset=0,
+                wrap_around=False,
+            )
         )
-        p.image_url(["interactive_plot/images/main.png"], x=x_low, y=y_high, h=y_high - y_low, w=x_low - x_high)
+        # linear from pixels to degrees, like the axes of the image
+        p.xaxis.formatter = FuncTickFormatter(code=f"return ({x_low} + tick * {(x_high - x_low) / width}).toFixed(3);")
+        p.yaxis.formatter = FuncTickFormatter(code=f"return ({y_low} + tick * {(y_high - y_low) / height}).toFixed(3);")
         p.xgrid.visible = False
         p.ygrid.visible = False
+        p.background_fill_color = "black"
 
         p.xaxis.axis_label = "RA (deg)"
         p.yaxis.axis_label = "DEC (deg)"
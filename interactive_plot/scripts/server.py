@@ -0,0 +1,233 @@
+import os
+import re
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from multiprocessing.dummy import Pool as ThreadPool
+from threading import Lock, get_ident
+
+import cv2 as cv
+
+__all__ = ["TileCache", "TileServer"]
+
+
+class TileCache:
+    """
+    TileCache keeps encoded tiles in memory and on disk, both bounded and least recently used out.
+    The disk cache has the same {zoom}/{x}/{y}.png layout as the tile pyramid, so pre-rendered tiles are used too.
+    """
+
+    def __init__(self, directory: str = None, memory_size: float = 256, disk_size: float = 10, prune_every: int = 256):
+        """
+        :param directory: directory of the disk cache (None for memory only)
+        :param memory_size: maximum size of the memory cache in MB
+        :param disk_size: maximum size of the disk cache in GB
+        :param prune_every: prune the disk cache after this many new tiles
+        """
+        self.directory = directory
+        self.memory_size = memory_size
+        self.disk_size = disk_size
+        self.prune_every = prune_every
+        self.memory = OrderedDict()
+        self.memory_bytes = 0
+        self.stored = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = Lock()
+        self.prune_lock = Lock()
+
+    def path(self, zoom: int = 0, x: int = 0, y: int = 0):
+        return f"{self.directory}/{zoom}/{x}/{y}.png"
+
+    def get(self, zoom: int = 0, x: int = 0, y: int = 0):
+        """
+        Get a tile from memory, or else from disk.
+        ------------------------------------------------------------
+        :param zoom: zoom level
+        :param x: tile column
+        :param y: tile row
+        :return: png bytes or None
+        """
+        with self.lock:
+            if (zoom, x, y) in self.memory:
+                self.memory.move_to_end((zoom, x, y))
+                self.hits += 1
+                return self.memory[(zoom, x, y)]
+        if self.directory is not None:
+            try:
+                with open(self.path(zoom, x, y), "rb") as f:
+                    png = f.read()
+                os.utime(self.path(zoom, x, y))  # mark as recently used
+            except FileNotFoundError:
+                pass
+            else:
+                self.remember((zoom, x, y), png)
+                with self.lock:
+                    self.hits += 1
+                return png
+        with self.lock:
+            self.misses += 1
+        return None
+
+    def remember(self, key: tuple = None, png: bytes = None):
+        """
+        Put a tile in the memory cache and forget the least recently used tiles when it is full.
+        """
+        with self.lock:
+            if key not in self.memory:
+                self.memory_bytes += len(png)
+            self.memory[key] = png
+            self.memory.move_to_end(key)
+            while self.memory_bytes > self.memory_size * 1e6 and len(self.memory) > 1:
+                self.memory_bytes -= len(self.memory.popitem(last=False)[1])
+
+    def put(self, zoom: int = 0, x: int = 0, y: int = 0, png: bytes = None):
+        """
+        Add a rendered tile to the cache.
+        ------------------------------------------------------------
+        :param zoom: zoom level
+        :param x: tile column
+        :param y: tile row
+        :param png: png bytes
+        """
+        self.remember((zoom, x, y), png)
+        if self.directory is None:
+            return self
+        os.makedirs(os.path.dirname(self.path(zoom, x, y)), exist_ok=True)
+        temp_file = f"{self.path(zoom, x, y)}.{os.getpid()}.{get_ident()}.tmp"
+        with open(temp_file, "wb") as f:
+            f.write(png)
+        os.replace(temp_file, self.path(zoom, x, y))
+        with self.lock:
+            self.stored += 1
+            prune = self.stored % self.prune_every == 0
+        if prune and self.prune_lock.acquire(blocking=False):
+            try:
+                self.prune()
+            finally:
+                self.prune_lock.release()
+        return self
+
+    def prune(self):
+        """
+        Remove the least recently used tiles from disk until the disk cache is smaller than disk_size.
+        """
+        tiles = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith(".png"):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(root, name))
+                except FileNotFoundError:
+                    continue
+                tiles.append((stat.st_mtime, stat.st_size, os.path.join(root, name)))
+        total_size = sum(tile[1] for tile in tiles)
+        for _, size, path in sorted(tiles):
+            if total_size <= self.disk_size * 1e9:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total_size -= size
+        return self
+
+
+class TileHandler(BaseHTTPRequestHandler):
+    """
+    Answers GET /{zoom}/{x}/{y}.png with a tile, rendered on the first request.
+    """
+
+    tile_path = re.compile(r"^/(\d+)/(\d+)/(\d+)\.png$")
+
+    def do_GET(self):
+        match = self.tile_path.match(self.path.split("?")[0])
+        png = self.server.tile(*(int(i) for i in match.groups())) if match else None
+        if png is None:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "image/png")
+        self.send_header("Content-Length", str(len(png)))
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.end_headers()
+        self.wfile.write(png)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class TileServer(HTTPServer):
+    """
+    TileServer is a local HTTP server for the tiles of an interactive plot.
+    Requests are answered by a pool of worker threads. Tiles come from the cache or are rendered on the first request,
+    and a tile that is requested again while it is rendered is only rendered once.
+    """
+
+    def __init__(
+        self,
+        render,
+        cache: TileCache = None,
+        address: tuple = ("localhost", 8000),
+        workers: int = None,
+        verbose: bool = False,
+    ):
+        """
+        :param render: function (zoom, x, y) to an RGB tile, or None when the tile does not exist
+        :param cache: TileCache (default: memory only)
+        :param address: (host, port)
+        :param workers: number of threads that answer requests (default: all cpu's)
+        :param verbose: print every request
+        """
+        super().__init__(address, TileHandler)
+        self.render = render
+        self.cache = cache or TileCache()
+        self.verbose = verbose
+        self.pool = ThreadPool(workers or os.cpu_count())
+        self.rendering = {}
+        self.rendering_lock = Lock()
+
+    def tile(self, zoom: int = 0, x: int = 0, y: int = 0):
+        """
+        Tile from the cache, or render it.
+        ------------------------------------------------------------
+        :param zoom: zoom level
+        :param x: tile column
+        :param y: tile row
+        :return: png bytes or None
+        """
+        png = self.cache.get(zoom, x, y)
+        if png is not None:
+            return png
+        with self.rendering_lock:
+            lock = self.rendering.setdefault((zoom, x, y), Lock())
+        with lock:  # other requests for this tile wait here
+            png = self.cache.get(zoom, x, y)
+            if png is None:
+                image = self.render(zoom, x, y)
+                if image is not None:
+                    png = cv.imencode(".png", cv.cvtColor(image, cv.COLOR_RGB2BGR))[1].tobytes()
+                    self.cache.put(zoom, x, y, png)
+        with self.rendering_lock:
+            self.rendering.pop((zoom, x, y), None)
+        return png
+
+    def process_request(self, request, client_address):
+        self.pool.apply_async(self.process_request_thread, (request, client_address))
+
+    def process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self.pool.terminate()
+
+
+if __name__ == "__main__":
+    print("Cannot call script directly.")
@@ -0,0 +1,99 @@
+import json
+import os
+import shutil
+from threading import get_ident
+
+import cv2 as cv
+import numpy as np
+
+__all__ = ["TILE_SIZE", "max_zoom", "tile_grid", "tile_data", "save_tile", "use_tile_directory"]
+
+TILE_SIZE = 256  # tile size in pixels
+
+
+def max_zoom(shape: tuple = None, tile_size: int = TILE_SIZE):
+    """
+    Zoom level at which the tiles have the full resolution of the image.
+    At zoom 0 the whole image fits in one tile, every next zoom level has twice the resolution.
+    ------------------------------------------------------------
+    :param shape: image shape (y, x)
+    :param tile_size: tile size in pixels
+    :return: highest zoom level
+    """
+    return max(int(np.ceil(np.log2(max(shape) / tile_size))), 0)
+
+
+def tile_grid(shape: tuple = None, zoom: int = 0, top: int = 0, tile_size: int = TILE_SIZE):
+    """
+    Tiles of one zoom level that cover the image, in TMS order (x from the left, y from the bottom).
+    ------------------------------------------------------------
+    :param shape: image shape (y, x)
+    :param zoom: zoom level
+    :param top: highest zoom level (see max_zoom)
+    :param tile_size: tile size in pixels
+    :return: list of (x, y)
+    """
+    span = tile_size * 2 ** (top - zoom)  # full resolution pixels per tile
+    return [(x, y) for x in range(-(-shape[1] // span)) for y in range(-(-shape[0] // span))]
+
+
+def tile_data(pyramid: list = None, level: int = 0, x: int = 0, y: int = 0, tile_size: int = TILE_SIZE):
+    """
+    Image data of one tile, from the pyramid level with the resolution of the tile.
+    When the pyramid does not go that far, the tile is reduced from the coarsest level by blocks (ignoring NaN pixels,
+    like the pyramid). Pixels outside the image are NaN.
+    ------------------------------------------------------------
+    :param pyramid: pyramid of the preprocessed image (level 0 is the full resolution image)
+    :param level: resolution of the tile, in halvings of the full resolution (highest zoom level minus the zoom)
+    :param x: tile column (from the left)
+    :param y: tile row (from the bottom, like the fits image)
+    :param tile_size: tile size in pixels
+    :return: tile data with shape (tile_size, tile_size), row 0 at the bottom
+    """
+    source = min(level, len(pyramid) - 1)
+    image_data, block = pyramid[source], 2 ** (level - source)
+    span = tile_size * block
+    data = np.full((span, span), np.nan, dtype=np.float32)
+    region = np.asarray(image_data[y * span : (y + 1) * span, x * span : (x + 1) * span])
+    data[: region.shape[0], : region.shape[1]] = region
+    if block > 1:
+        data = np.nanmean(data.reshape(tile_size, block, tile_size, block), axis=(1, 3))
+    return data
+
+
+def save_tile(tile_file: str = None, image=None):
+    """
+    Save a tile as png. The tile is written under a temporary name and renamed, so a tile file is always complete.
+    ------------------------------------------------------------
+    :param tile_file: tile file name
+    :param image: RGB image
+    """
+    os.makedirs(os.path.dirname(tile_file), exist_ok=True)
+    temp_file = f"{tile_file}.{os.getpid()}.{get_ident()}.tmp.png"
+    cv.imwrite(temp_file, cv.cvtColor(image, cv.COLOR_RGB2BGR))
+    os.replace(temp_file, tile_file)
+
+
+def use_tile_directory(directory: str = None, info: dict = None):
+    """
+    Use a tile directory for an image. The settings of the tiles are kept in tiles.json,
+    when the tiles in the directory are from another image or other settings they are removed.
+    ------------------------------------------------------------
+    :param directory: tile directory
+    :param info: everything that determines the tiles (JSON serializable)
+    """
+    info_file = f"{directory}/tiles.json"
+    try:
+        with open(info_file) as f:
+            old_info = json.load(f)
+    except (FileNotFoundError, ValueError):
+        old_info = None
+    if old_info != json.loads(json.dumps(info)):
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory, exist_ok=True)
+        with open(info_file, "w") as f:
+            json.dump(info, f)
+
+
+if __name__ == "__main__":
+    print("Cannot call script directly.")
@@ -0,0 +1,31 @@
+import argparse
+
+from benchmark.scripts.benchmarks import Benchmark, compare
+
+parser = argparse.ArgumentParser("Benchmark the imaging and movie making on a synthetic fits image.")
+parser.add_argument("-si", "--size", type=int, default=2000, help="Size of the synthetic image in pixels")
+parser.add_argument("-fr", "--frames", type=int, default=20, help="Number of frames of the zoom and move segments")
+parser.add_argument("-cu", "--cutouts", type=int, default=50, help="Number of cutouts")
+parser.add_argument("-en", "--engine", type=str, default="matplotlib", help="Render engine [matplotlib, numpy, agg]")
+parser.add_argument("-pr", "--process", type=str, help="Process of the movie [multiprocess, multithread]")
+parser.add_argument("-wo", "--workers", type=int, help="Number of threads or processes")
+parser.add_argument("-o", "--output", type=str, default="benchmark.json", help="JSON file for the results")
+parser.add_argument("-co", "--compare", type=str, help="JSON results of an earlier run to compare with")
+parser.add_argument("-di", "--directory", type=str, help="Working directory, to keep the synthetic fits file")
+args = parser.parse_args()
+
+if __name__ == "__main__":
+    Bench = Benchmark(
+        size=args.size,
+        frames=args.frames,
+        cutouts=args.cutouts,
+        engine=args.engine,
+        process=args.process,
+        workers=args.workers,
+        directory=args.directory,
+    )
+    Bench.run().save(args.output)
+    if not args.directory:
+        Bench.clean()
+    if args.compare:
+        compare(args.compare, args.output)
@@ -1,6 +1,9 @@
 import argparse
 import os
 
+import numpy as np
+import pandas as pd
+
 from poster.scripts.imaging import ImagingLofar
 
 parser = argparse.ArgumentParser("Make cutout image from fits file.")
@@ -9,6 +12,10 @@ parser.add_argument("-ra", "--right_ascension", type=float, help="RA in degrees"
 parser.add_argument("-dec", "--declination", type=float, help="DEC in degrees")
 parser.add_argument("-si", "--image_size", type=float, help="Image size in degrees (for squared region)")
 parser.add_argument("-ia", "--interactive", type=bool, default=True, help="Display image in interactive mode")
+parser.add_argument(
+    "-csv", "--csvfile", type=str, help="Csv file with RA and DEC in degrees (and imsize), to make all cutouts at once"
+)
+parser.add_argument("-wo", "--workers", type=int, help="Number of processes for the cutouts of the csv file")
 args = parser.parse_args()
 
 if args.image_size:
@@ -16,13 +23,32 @@ if args.image_size:
 else:
     imsize = 0.4
 
-filename = "_".join(args.fits.split("/")[-1].split(".")[0:-1] + [str(args.right_ascension), str(args.declination)])
+name = "_".join(args.fits.split("/")[-1].split(".")[0:-1])
+
+Image = ImagingLofar(fits_file=args.fits, image_directory="cutouts", verbose=False, workers=args.workers)
 
-Image = ImagingLofar(fits_file=args.fits, image_directory="cutouts", verbose=False)
-Image.image_cutout(image_name=filename + ".png", dpi=100, pos=(args.right_ascension, args.declination), imsize=imsize)
-print(f"Made {filename}.png")
-Image.make_fits(pos=(args.right_ascension, args.declination), imsize=0.4, filename=filename + ".fits")
-print(f"Made {filename}.fits")
+if args.csvfile:
+    # batch mode: the fits file is opened and preprocessed once for all positions
+    df = pd.read_csv(args.csvfile)
+    positions = np.full((len(df), 4), np.nan)
+    positions[:, :2] = df[["RA", "DEC"]].to_numpy()
+    imsizes = df["imsize"].fillna(imsize).to_numpy() if "imsize" in df else imsize
+    failed = Image.image_cutouts(
+        positions,
+        dpi=100,
+        image_name=name + "_{ra}_{dec}.png",
+        imsize=imsizes,
+        fits_name=name + "_{ra}_{dec}.fits",
+    )
+    print(f"Made {len(df) - len(failed)} cutouts (png and fits) in '{Image.image_directory}'")
+else:
+    filename = "_".join([name, str(args.right_ascension), str(args.declination)])
+    Image.image_cutout(
+        image_name=filename + ".png", dpi=100, pos=(args.right_ascension, args.declination), imsize=imsize
+    )
+    print(f"Made {filename}.png")
+    Image.make_fits(pos=(args.right_ascension, args.declination), imsize=0.4, filename=filename + ".fits")
+    print(f"Made {filename}.fits")
 
-if args.interactive:
-    os.system(f"python make_interactive.py -fi cutouts/{filename}.fits")
+    if args.interactive:
+        os.system(f"python make_interactive.py -fi cutouts/{filename}.fits")
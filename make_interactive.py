@@ -7,21 +7,26 @@ from interactive_plot.scripts.interactive_plot import Interactive
 parser = argparse.ArgumentParser("Make interactive plo from fits file.")
 parser.add_argument("-d", "--downloading", type=int, help="download your own data")
 parser.add_argument("-fi", "--fits", type=str, help="fits file to use")
+parser.add_argument(
+    "-mm", "--memmap", action="store_true", help="Keep the image on disk, for images larger than memory"
+)
+parser.add_argument("-th", "--threads", type=int, help="Number of threads for rendering the tiles")
+parser.add_argument("-se", "--serve", action="store_true", help="Render the tiles on request with a local tile server")
+parser.add_argument("-po", "--port", type=int, default=8000, help="Port of the tile server")
 args = parser.parse_args()
 
 if __name__ == "__main__":
     if args.downloading == 1:
-        download = input("Paste here your url where to find the fits file: ")
-        fits_download = True
-        Image = Interactive(fits_download=True)
+        Image = Interactive(fits_download=True, memmap=args.memmap, workers=args.threads)
     else:
-        fits_download = False
         if args.fits:
             file = args.fits
         else:
             file = "fits/mosaic-blanked.fits"
-        Image = Interactive(fits_file=get_pkg_data_filename(file))
+        Image = Interactive(fits_file=get_pkg_data_filename(file), memmap=args.memmap, workers=args.threads)
 
-    image = Interactive(fits_file=file)
-    image.imaging(image_name="main.png", save=True, dpi=750)
-    image.html_from_png()
+    if args.serve:
+        Image.serve(port=args.port)
+    else:
+        Image.make_tiles()
+        Image.html_from_png()
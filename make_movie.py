@@ -1,4 +1,5 @@
 import argparse
+import sys
 import warnings
 from timeit import default_timer as timer
 
@@ -8,6 +9,8 @@ from astropy.utils.data import get_pkg_data_filename
 
 from video.scripts.paths import ScanPaths
 from video.scripts.moviemaker import MovieMaker
+from video.scripts.plan import FramePlan, parse_shard
+from video.scripts.route import optimize_route
 
 warnings.filterwarnings("ignore")
 
@@ -19,16 +22,76 @@ parser.add_argument("-zs", "--zoomsize", type=float, help="Size in deg of the zo
 parser.add_argument("-dr", "--degrate", type=float, help="Amount of degrees traversed each second")
 parser.add_argument("-fi", "--fits", type=str, help="Fits file to use")
 parser.add_argument("-sc", "--scan", type=str, help="Scanning path type")
+parser.add_argument("-en", "--engine", type=str, default="matplotlib", help="Render engine [matplotlib, numpy, agg]")
+parser.add_argument("-st", "--stream", action="store_true", help="Pipe frames directly into ffmpeg")
+parser.add_argument("-re", "--resume", action="store_true", help="Resume a crashed render, only make missing frames")
+parser.add_argument("-ca", "--cache", type=str, help="Directory of a frame cache that is reused across runs")
+parser.add_argument("-py", "--pyramid", action="store_true", help="Render wide frames from a multi-resolution pyramid")
+parser.add_argument(
+    "-mm", "--memmap", action="store_true", help="Keep the image on disk, for images larger than memory"
+)
+parser.add_argument("-ti", "--timing", type=str, help="JSON-lines file for the time of every stage of every frame")
+parser.add_argument("-pr", "--process", type=str, help="Process of the frames [multiprocess, multithread]")
+parser.add_argument("-pl", "--plan", type=str, help="Frame plan file, to render the movie in shards")
+parser.add_argument("-sh", "--shard", type=str, help="Render shard i/n of the frame plan (i from 0 to n-1)")
+parser.add_argument("-me", "--merge", action="store_true", help="Check the frames of the frame plan and record")
+parser.add_argument(
+    "-kf", "--keyframes", type=float, help="Zoom from keyframes, with this maximum upscaling (e.g. 1.5)"
+)
+parser.add_argument("-pc", "--pancanvas", action="store_true", help="Render the region of a pan once and slide over it")
+parser.add_argument("-ro", "--route", action="store_true", help="Reorder the csv sources for the shortest route")
+parser.add_argument(
+    "-dry", "--dryrun", action="store_true", help="Only estimate the frames, time and disk of the movie"
+)
 args = parser.parse_args()
+if (args.shard or args.merge) and not args.plan:
+    parser.error("--shard and --merge need the frame plan (--plan)")
 
 
 def distance(obj_1, obj_2):
-    return np.sqrt((obj_1[0] - obj_2[0]) ** 2 + 4 * (obj_1[1] - obj_2[1]) ** 2)
+    d_ra = (obj_1[0] - obj_2[0] + 180) % 360 - 180  # move_to crosses RA 0/360 the short way
+    return np.sqrt(d_ra**2 + 4 * (obj_1[1] - obj_2[1]) ** 2)
+
+
+def frames(obj_1, obj_2, framerate):
+    """
+    Number of frames of a move from obj_1 to obj_2 (also for arrays of positions).
+    """
+    return np.maximum(4 * framerate * distance(obj_1, obj_2), 2).astype(int)
+
+
+def move_frames(route, framerate):
+    """
+    Number of frames of the moves along a route.
+    ------------------------------------------------------------
+    :param route: positions (ra, dec) in degrees
+    :param framerate: frame rate
+    :return: number of frames of every move
+    """
+    route = np.asarray(route, dtype=float)
+    return frames(route[:-1].T, route[1:].T, framerate).tolist()
 
 
 if __name__ == "__main__":
     start = timer()
 
+    if args.merge:  # record the movie when all shards are done
+        sys.exit(0 if FramePlan.load(args.plan).merge() else 1)
+
+    if args.shard:  # render a part of the frame plan, with the settings of the plan
+        Movie = MovieMaker(
+            **FramePlan.load(args.plan).settings,
+            process=args.process,
+            cache=args.cache,
+            memmap=args.memmap,
+            timing=args.timing,
+            plan=args.plan,
+            shard=parse_shard(args.shard),
+        )
+        Movie.render_plan()
+        print(f"Shard {args.shard} took {int(timer() - start)} seconds")
+        sys.exit(1 if Movie.failed_frames else 0)
+
     if args.framerate:
         FRAMERATE = args.framerate
     else:
@@ -47,7 +110,23 @@ if __name__ == "__main__":
     if args.downloading == 1:
         download = input("Paste here your url where to find the fits file: ")
         fits_download = True
-        Movie = MovieMaker(fits_download=True, imsize=0.4, framerate=FRAMERATE)  # default imsize
+        Movie = MovieMaker(
+            fits_download=True,
+            imsize=0.4,
+            framerate=FRAMERATE,
+            engine=args.engine,
+            stream=args.stream,
+            resume=args.resume,
+            cache=args.cache,
+            pyramid=args.pyramid,
+            memmap=args.memmap,
+            timing=args.timing,
+            process=args.process,
+            plan=args.plan,
+            keyframe_upscale=args.keyframes,
+            pan_canvas=args.pancanvas,
+            dry_run=args.dryrun,
+        )  # default imsize
     else:
         fits_download = False
         if args.fits:
@@ -58,7 +137,24 @@ if __name__ == "__main__":
             fitsfile = get_pkg_data_filename(file)
         except BaseException:
             fitsfile = file
-        Movie = MovieMaker(fits_file=fitsfile, imsize=0.4, framerate=FRAMERATE, zoom_effect=False)  # default imsize
+        Movie = MovieMaker(
+            fits_file=fitsfile,
+            imsize=0.4,
+            framerate=FRAMERATE,
+            zoom_effect=False,
+            engine=args.engine,
+            stream=args.stream,
+            resume=args.resume,
+            cache=args.cache,
+            pyramid=args.pyramid,
+            memmap=args.memmap,
+            timing=args.timing,
+            process=args.process,
+            plan=args.plan,
+            keyframe_upscale=args.keyframes,
+            pan_canvas=args.pancanvas,
+            dry_run=args.dryrun,
+        )  # default imsize
 
     if args.csvfile:  # go through all objects in csv file
         df = pd.read_csv(args.csvfile)[["RA", "DEC", "imsize"]]
@@ -67,25 +163,34 @@ if __name__ == "__main__":
         start_dec = start_coord.dec.degree
         start_ra = start_coord.ra.degree
 
+        route = [(start_ra, start_dec)] + list(zip(df["RA"].values, df["DEC"].values)) + [(start_ra, start_dec)]
+        if args.route:  # shortest route before rendering, the frames of the moves follow the distance
+            order = optimize_route(  # the route with the fewest move frames
+                df["RA"].values,
+                df["DEC"].values,
+                start=(start_ra, start_dec),
+                metric=lambda ra, dec: frames((ra[:, None], dec[:, None]), (ra, dec), Movie.framerate),
+            )
+            df = df.iloc[order].reset_index(drop=True)
+            frames_before = sum(move_frames(route, Movie.framerate))
+            route = [route[0]] + [route[1:-1][n] for n in order] + [route[-1]]
+            frames_after = sum(move_frames(route, Movie.framerate))
+            print(
+                f"Optimized route: {frames_before} -> {frames_after} move frames, {frames_before - frames_after} saved"
+            )
+        move_to_frames = move_frames(route, Movie.framerate)
+
         Movie.zoom(N_frames=int(5 * Movie.framerate), first_time=True)
-        for n in range(len(df) - 1):  # stack multiple sources
-            if n > 0:
-                dist = distance([last_RA, last_DEC], [df["RA"].values[n], df["DEC"].values[n]])
-                move_to_frames = np.max(int(4 * dist * Movie.framerate), 2)
-            else:
-                dist = distance([start_ra, start_dec], [df["RA"].values[n], df["DEC"].values[n]])
-                move_to_frames = np.max(int(4 * dist * Movie.framerate), 2)
-            Movie.move_to(N_frames=move_to_frames, ra=df["RA"].values[n], dec=df["DEC"].values[n])
-            zoom_frames = np.max(int(0.1 * Movie.framerate * Movie.imsize / df["imsize"].values[n]), 2)
+        for n in range(len(df)):  # stack multiple sources
+            Movie.move_to(N_frames=move_to_frames[n], ra=df["RA"].values[n], dec=df["DEC"].values[n])
+            zoom_frames = max(int(0.1 * Movie.framerate * Movie.imsize / df["imsize"].values[n]), 2)
             Movie.zoom(N_frames=zoom_frames, imsize_out=df["imsize"].values[n])
             if n < len(df) - 1 and df["imsize"].values[n + 1] > df["imsize"].values[n]:
-                im_out = np.max(df["imsize"].values[n + 1] + 0.3, 0.3)
+                im_out = max(df["imsize"].values[n + 1] + 0.3, 0.3)
             else:
-                im_out = np.max(df["imsize"].values[n] + 0.3, 0.3)
-            Movie.zoom(N_frames=np.max(zoom_frames // 5, 1), imsize_out=im_out)
-            last_RA, last_DEC = df["RA"].values[n], df["DEC"].values[n]
-        move_to_frames = np.max(int(4 * Movie.framerate * distance([start_ra, start_dec], [last_RA, last_DEC])), 2)
-        Movie.move_to(N_frames=move_to_frames, ra=start_ra, dec=start_dec)
+                im_out = max(df["imsize"].values[n] + 0.3, 0.3)
+            Movie.zoom(N_frames=max(zoom_frames // 5, 1), imsize_out=im_out)
+        Movie.move_to(N_frames=move_to_frames[-1], ra=start_ra, dec=start_dec)
         Movie.zoom(N_frames=int(5 * Movie.framerate), imsize_out=2)
         Movie.record()
 
@@ -93,7 +198,7 @@ if __name__ == "__main__":
         print(f"MovieMaker took {int(end - start)} seconds")
 
     else:  # Go through whole field
-        full_size = Movie.image_data.shape[0] * np.max(Movie.wcs.pixel_scale_matrix)
+        full_size = Movie.image_data.shape[0] * Movie.pixel_scale
 
         Path = ScanPaths(movie_obj=Movie, zoom_size=ZOOMSIZE, deg_per_sec=DEGRATE)
 
@@ -1,9 +1,11 @@
 import argparse
 import os
+import sys
 
 import pandas as pd
 from astropy.utils.data import get_pkg_data_filename
 
+from poster.scripts.estimate import estimate_poster
 from poster.scripts.imaging import ImagingLofar
 
 parser = argparse.ArgumentParser("Make poster from fits file.")
@@ -15,6 +17,10 @@ parser.add_argument(
     default="catalogue/catalogue_lockman.csv",
 )
 parser.add_argument("-fi", "--fits", type=str, help="fits file to use")
+parser.add_argument(
+    "-dry", "--dryrun", action="store_true", help="only estimate the pixels, time and disk of the poster"
+)
+parser.add_argument("-wo", "--workers", type=int, help="number of processes for the cutouts (default: all cpu's)")
 args = parser.parse_args()
 
 if __name__ == "__main__":
@@ -26,24 +32,22 @@ if __name__ == "__main__":
     if args.downloading == 1:
         download = input("Paste here your url where to find the fits file: ")
         fits_download = True
-        Image = ImagingLofar(fits_download=True)
+        Image = ImagingLofar(fits_download=True, workers=args.workers)
     else:
         fits_download = False
         if args.fits:
             file = args.fits
         else:
             file = "fits/lockman_hole.fits"
-        Image = ImagingLofar(fits_file=get_pkg_data_filename(file))
+        Image = ImagingLofar(fits_file=get_pkg_data_filename(file), workers=args.workers)
 
-    Image.imaging(image_name="main.png", save=True, dpi=3000)
+    cmap = "jet"  # of the cutouts
+    if args.dryrun:
+        estimate_poster(Image, cutouts=list(df), dpi=3000, cmap=cmap)
+        sys.exit()
 
-    for n, position in enumerate(df):
-        if position[3] == position[3]:
-            Image.image_cutout(
-                pos=tuple(position[0:2]), size=tuple(position[2:4]), image_name=f"cutout_{n}.png", save=True, cmap="jet"
-            )
-        else:
-            Image.image_cutout(pos=tuple(position[0:2]), image_name=f"cutout_{n}.png", save=True, cmap="jet")
+    # the cutouts are made in worker processes while the main image is streamed to main.png in strips
+    Image.image_cutouts(df, cmap=cmap, image_name="cutout_{n}.png", main=dict(image_name="main.png", dpi=3000))
 
     try:
         os.system("python poster/scripts/make_pdf.py")
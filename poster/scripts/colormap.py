@@ -0,0 +1,62 @@
+from threading import Lock
+
+import numpy as np
+from matplotlib import cm
+
+__all__ = ["ColormapLUT"]
+
+
+class ColormapLUT:
+    """
+    ColormapLUT maps normalised data (between 0 and 1) to RGB values with a precomputed lookup table.
+    This is what matplotlib does inside imshow, but without building a figure.
+    """
+
+    _tables = {}
+    _lock = Lock()
+
+    def __init__(self, cmap: str = "CMRmap", lut_size: int = 256, bad: tuple = (0, 0, 0)):
+        """
+        :param cmap: matplotlib cmap name
+        :param lut_size: number of colours in the lookup table (256 is what imshow uses, 65536 for smooth gradients)
+        :param bad: RGB colour for NaN pixels (black, like the facecolor of the saved figures)
+        """
+        self.cmap = cmap
+        self.lut_size = lut_size
+        colours = cm.get_cmap(cmap, lut_size)(np.arange(lut_size))[:, :3]
+        self.table = np.round(colours * 255).astype(np.uint8)
+        self.bad = np.array(bad, dtype=np.uint8)
+
+    @classmethod
+    def get(cls, cmap: str = "CMRmap", lut_size: int = 256):
+        """
+        Get a cached lookup table, so it is only computed once per cmap.
+        ------------------------------------------------------------
+        :param cmap: matplotlib cmap name
+        :param lut_size: number of colours in the lookup table
+        :return: ColormapLUT instance
+        """
+        with cls._lock:
+            if (cmap, lut_size) not in cls._tables:
+                cls._tables[(cmap, lut_size)] = cls(cmap=cmap, lut_size=lut_size)
+            return cls._tables[(cmap, lut_size)]
+
+    def __call__(self, normed_data):
+        """
+        Map normalised data to colours.
+        ------------------------------------------------------------
+        :param normed_data: output of a matplotlib norm (masked or with NaN)
+        :return: RGB image as uint8 array
+        """
+        normed_data = np.ma.filled(np.ma.asarray(normed_data, dtype=np.float32), np.nan)
+        bad = ~np.isfinite(normed_data)
+        # same binning as matplotlib: floor(x * N), with over and under values on the end colours
+        index = np.clip(normed_data * self.lut_size, 0, self.lut_size - 1)
+        index[bad] = 0
+        rgb = self.table[index.astype(np.intp)]
+        rgb[bad] = self.bad
+        return rgb
+
+
+if __name__ == "__main__":
+    print("Cannot call script directly.")
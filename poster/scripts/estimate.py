@@ -0,0 +1,174 @@
+import os
+import shutil
+import tempfile
+from multiprocessing.dummy import Pool as ThreadPool
+from time import perf_counter
+
+import numpy as np
+from termcolor import colored
+
+from poster.scripts.pngstream import compress_strip
+
+__all__ = ["format_bytes", "format_seconds", "predict", "print_report", "estimate_poster"]
+
+
+def format_bytes(n_bytes: float = 0):
+    """
+    Human readable size.
+    ------------------------------------------------------------
+    :param n_bytes: size in bytes
+    :return: size text
+    """
+    for unit in ["B", "kB", "MB", "GB"]:
+        if abs(n_bytes) < 1000:
+            return f"{n_bytes:.1f} {unit}"
+        n_bytes /= 1000
+    return f"{n_bytes:.1f} TB"
+
+
+def format_seconds(seconds: float = 0):
+    """
+    Human readable duration.
+    ------------------------------------------------------------
+    :param seconds: duration in seconds
+    :return: duration text
+    """
+    seconds = int(round(seconds))
+    if seconds < 60:
+        return f"{seconds}s"
+    if seconds < 3600:
+        return f"{seconds // 60}m{seconds % 60:02d}s"
+    return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m"
+
+
+def predict(sample_x, sample_y, x):
+    """
+    Predict from a few samples with a straight line y = a + b * x (a and b not negative).
+    With one sample, y is taken proportional to x.
+    ------------------------------------------------------------
+    :param sample_x: x of the samples (for example pixels)
+    :param sample_y: y of the samples (for example seconds)
+    :param x: x to predict y for
+    :return: predicted y
+    """
+    sample_x, sample_y, x = np.asarray(sample_x, float), np.asarray(sample_y, float), np.asarray(x, float)
+    if len(sample_x) < 2 or np.ptp(sample_x) == 0:
+        return x * np.mean(sample_y) / max(np.mean(sample_x), 1e-12)
+    slope, intercept = np.polyfit(sample_x, sample_y, 1)
+    if slope < 0:
+        slope, intercept = 0, np.mean(sample_y)
+    elif intercept < 0:
+        slope, intercept = np.sum(sample_x * sample_y) / np.sum(sample_x**2), 0
+    return intercept + slope * x
+
+
+def print_report(title: str = "Dry run", rows: list = None):
+    """
+    Print a dry run report.
+    ------------------------------------------------------------
+    :param title: title of the report
+    :param rows: list of (name, value)
+    """
+    print(colored(title, "green"))
+    for name, value in rows or []:
+        print(f"{name.ljust(24)}{value}")
+
+
+def estimate_poster(
+    image,
+    cutouts: list = None,
+    dpi: int = 3000,
+    cmap: str = "jet",
+    sample_strips: int = 8,
+    sample_pixels: tuple = (2**20, 2**22),
+):
+    """
+    Estimate the pixels, time and disk of a poster (dry run): the main image and the cutouts.
+    A few strips of the main image, spread over the image, are made at the real dpi (as in poster_image), and the time
+    and compressed size are scaled with the number of strips.
+    The first cutout is made at a few lower dpi's in a temporary directory, the time and file size are extrapolated
+    with the number of output pixels (which grows with dpi**2). These samples have at least a million pixels, so the
+    time is mostly the work per pixel and not the fixed overhead.
+    ------------------------------------------------------------
+    :param image: ImagingLofar object
+    :param cutouts: list of (RA, DEC, size_x, size_y) of the cutouts, the sizes in pixels (or NaN for the default)
+    :param dpi: dots per inch of the main image
+    :param cmap: cmap of the cutouts
+    :param sample_strips: number of strips of the main image to make (at least one per thread)
+    :param sample_pixels: output pixels of the cutouts to calibrate with (at most the pixels at the real dpi)
+    :return: estimate as dictionary
+    """
+    cutouts = cutouts or []
+    image_directory = image.image_directory
+    image.image_directory = tempfile.mkdtemp(prefix="dryrun_")
+
+    def calibrate(make_image, pixels_per_dpi2, max_dpi):  # pixels, seconds and bytes of the sample images
+        sample_dpis = sorted({max(int(min(np.sqrt(p / pixels_per_dpi2), max_dpi)), 1) for p in sample_pixels})
+        pixels, seconds, sizes = [], [], []
+        for n, sample_dpi in enumerate([min(20, sample_dpis[0])] + sample_dpis):  # the first image warms up
+            start = perf_counter()
+            make_image(sample_dpi, f"sample_{n}.png")
+            if n > 0:
+                pixels.append(pixels_per_dpi2 * sample_dpi**2)
+                seconds.append(perf_counter() - start)
+                sizes.append(os.path.getsize(f"{image.image_directory}/sample_{n}.png"))
+        return pixels, seconds, sizes
+
+    try:
+        # the main image gets one thread while the cutouts are made in worker processes (see image_cutouts)
+        main_workers = 1 if image.workers > 1 and len(cutouts) > 1 else image.workers
+        start = perf_counter()
+        main_size, starts, make_strip = image.poster_strips(dpi=dpi)
+        main_pixels = main_size[0] * main_size[1]
+        setup_seconds = perf_counter() - start
+        sample = np.linspace(0, len(starts) - 1, max(sample_strips, main_workers)).astype(int)
+        strips = [starts[n] for n in np.unique(sample)]
+        start = perf_counter()
+        with ThreadPool(main_workers) as p:
+            strip_bytes = p.map(lambda first_row: len(compress_strip(make_strip(first_row))[1]), strips, chunksize=1)
+        main_seconds = setup_seconds + (perf_counter() - start) * len(starts) / len(strips)
+        main_bytes = np.sum(strip_bytes) * len(starts) / len(strips)
+        cutout_dpis = [min(1000, cutout[2]) if cutout[3] == cutout[3] else 1000 for cutout in cutouts]
+        cutout_seconds, cutout_bytes = np.zeros(len(cutouts)), np.zeros(len(cutouts))
+        if cutouts:
+            position = tuple(cutouts[0][:2])
+            size = tuple(cutouts[0][2:4]) if cutouts[0][3] == cutouts[0][3] else None
+            sample = calibrate(
+                lambda d, name: image.image_cutout(pos=position, size=size, dpi=d, image_name=name, cmap=cmap),
+                9 * 16,
+                max_dpi=max(cutout_dpis),
+            )
+            cutout_seconds = predict(sample[0], sample[1], 9 * 16 * np.array(cutout_dpis, float) ** 2)
+            cutout_bytes = predict(sample[0], sample[2], 9 * 16 * np.array(cutout_dpis, float) ** 2)
+    finally:
+        shutil.rmtree(image.image_directory, ignore_errors=True)
+        image.image_directory = image_directory
+
+    estimate = dict(
+        image_pixels=int(np.prod(image.image_data.shape)),
+        main_pixels=int(main_pixels),
+        main_seconds=float(main_seconds),
+        main_bytes=float(main_bytes),
+        cutouts=len(cutouts),
+        cutout_pixels=int(sum(9 * 16 * d**2 for d in cutout_dpis)),
+        cutout_seconds=float(np.sum(cutout_seconds)),
+        cutout_bytes=float(np.sum(cutout_bytes)),
+    )
+    print_report(
+        "Dry run of the poster (nothing is saved)",
+        [
+            ("Image", f"{image.image_data.shape[1]} x {image.image_data.shape[0]} pixels"),
+            ("Main image", f"{main_size[0]} x {main_size[1]} pixels (dpi {dpi})"),
+            ("Cutouts", f"{len(cutouts)}, {estimate['cutout_pixels'] / 1e6:.0f} Mpix in total"),
+            (
+                "Predicted time",
+                f"{format_seconds(main_seconds)} main image, {format_seconds(np.sum(cutout_seconds))} cutouts",
+            ),
+            ("Disk", f"{format_bytes(main_bytes)} main image, {format_bytes(np.sum(cutout_bytes))} cutouts"),
+        ],
+    )
+    return estimate
+
+
+if __name__ == "__main__":
+    print("Cannot call script directly.")
@@ -1,5 +1,9 @@
 import os
 import warnings
+import weakref
+from functools import partial
+from multiprocessing import Pool
+from multiprocessing.dummy import Pool as ThreadPool
 
 import astropy.units as u
 import matplotlib.pyplot as plt
@@ -7,16 +11,26 @@ import numpy as np
 from astropy import coordinates
 from astropy import wcs
 from astropy.io import fits
-from astropy.nddata import Cutout2D
 from astropy.utils.data import download_file
-from astropy.wcs import WCS
-from matplotlib.colors import LogNorm, SymLogNorm
-from scipy.ndimage import gaussian_filter
+from astropy.wcs import WCS, Sip
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.colors import LogNorm, Normalize, SymLogNorm
+from matplotlib.figure import Figure
+from termcolor import colored
+
+from poster.scripts.colormap import ColormapLUT
+from poster.scripts.lazyfits import LazyImage, block_rows, image_hdu, nanstd, new_memmap, row_blocks
+from poster.scripts.pngstream import PNGStream
+from poster.scripts.preprocess import preprocess, tonemap_maxima
+from poster.scripts.sharedpool import cutout_worker, init_worker, share
+from poster.scripts.timing import StageTimer
 
 warnings.filterwarnings("ignore")
 
 __all__ = ["ImagingLofar"]
 
+TONEMAP_CHUNK = 2**16  # pixels that are tonemapped at once
+
 
 class ImagingLofar:
     def __init__(
@@ -29,6 +43,10 @@ class ImagingLofar:
         verbose: bool = True,
         zoom_effect: bool = True,
         interactive: bool = False,
+        pyramid: bool = False,
+        memmap: bool = False,
+        workers: int = None,
+        timing: str = None,
     ):
         """
         Make LOFAR images (also applicable on other telescope surveys)
@@ -39,7 +57,16 @@ class ImagingLofar:
         :param vmax: cutoff max flux
         :param image_directory: directory to output the images
         :param verbose: printing extra comments during making
+        :param pyramid: build a multi-resolution pyramid, so cutouts of large regions are made from a smaller image
+        :param memmap: keep the image on disk, for images larger than memory. The fits file is read in blocks and
+                       the preprocessed image is a memory-mapped temporary file.
+        :param workers: number of threads for preprocessing the image (default: all cpu's)
+        :param timing: JSON-lines file for the time of every stage (load, tonemap, filter, cutout, norm, draw, ...)
         """
+        self.timer = StageTimer(timing)
+        if fits_download:
+            link = input("Past here your fits link: \n")
+            fits_file = download_file(link, cache=True)  # path of the downloaded fits file in the astropy cache
         self.fits_file = fits_file
         self.verbose = verbose
         self.zoom_effect = zoom_effect
@@ -47,21 +74,28 @@ class ImagingLofar:
             print(
                 f"Started imaging {fits_file.split('/')[-1].replace('.fits', '').replace('_', ' ').replace('.', ' ').title()}..."
             )
-        if fits_download:
-            link = input("Past here your fits link: \n")
-            self.hdu = download_file(link, cache=True)
-        else:
-            self.hdu = fits.open(fits_file)[0]
-        self.image_data = self.hdu.data
-        while len(self.image_data.shape) != 2:
-            self.image_data = self.image_data[0]
+        self.hdu = image_hdu(fits.open(fits_file))
+        self.memmap = memmap
+        self.workers = workers or os.cpu_count()
+        with self.timer.stage("load"):
+            if self.memmap:
+                self.image_data = LazyImage(self.hdu)
+            else:
+                self.image_data = self.hdu.data
+                while len(self.image_data.shape) != 2:
+                    self.image_data = self.image_data[0]
+        self.header = self.hdu.header
         self.wcs = WCS(self.hdu.header, naxis=2)
+        self.pixel_scale = np.max(self.wcs.pixel_scale_matrix)  # degrees per pixel
+        if vmin is None or vmax is None:
+            with self.timer.stage("statistics"):
+                std = nanstd(self.image_data) if self.memmap else np.nanstd(self.image_data)
         if vmin is None:
-            self.vmin = np.nanstd(self.image_data)
+            self.vmin = std
         else:
             self.vmin = vmin
         if vmax is None:
-            self.vmax = np.nanstd(self.image_data) * 20
+            self.vmax = std * 20
         else:
             self.vmax = vmax
         self.image_directory = image_directory
@@ -78,52 +112,172 @@ class ImagingLofar:
         # Transfer function
         if not interactive:
             if "cutout" in self.fits_file:
-                self.image_data = gaussian_filter(
-                    self.tonemap(image_data=self.image_data, b=0.25, threshold=self.vmin), sigma=3
-                )
+                b, threshold, sigmas = 0.25, self.vmin, [3]
             elif "ILTJ" in self.fits_file:
-                self.image_data = gaussian_filter(
-                    self.tonemap(image_data=self.image_data, b=0.25, threshold=self.vmin / 1.5), sigma=4
-                )
+                b, threshold, sigmas = 0.25, self.vmin / 1.5, [4]
             else:
                 if self.zoom_effect:
-                    self.image_data = gaussian_filter(
-                        self.tonemap(image_data=self.image_data, b=0.5, threshold=0), sigma=2
-                    )
+                    b, threshold, sigmas = 0.5, 0, [2]
                 else:
-                    self.image_data = gaussian_filter(
-                        self.tonemap(image_data=self.image_data, b=0.25, threshold=self.vmin / 100), sigma=1
-                    )
+                    b, threshold, sigmas = 0.25, self.vmin / 100, [1]
         else:
-            self.image_data = gaussian_filter(
-                self.tonemap(image_data=self.image_data, b=0.25, threshold=self.vmin / 100), sigma=1
+            b, threshold, sigmas = 0.25, self.vmin / 100, [1]
+        with self.timer.stage("maxima"):
+            maxima = tonemap_maxima(self.image_data, threshold=threshold, workers=self.workers)
+        self.image_data = preprocess(
+            self.image_data,
+            partial(self.tonemap, b=b, threshold=threshold, maxima=maxima),
+            sigmas=sigmas,
+            memmap=self.memmap,
+            workers=self.workers,
+            timer=self.timer,
+        )
+        # frames, image cutouts and the main image of the zoom effect are smoothed once more, this is done here for the
+        # full image at once and kept apart, so fits cutouts and the interactive tiles use the image as above
+        self.frame_data = self.image_data
+        if self.zoom_effect and "cutout" not in self.fits_file and not interactive:
+            self.frame_data = preprocess(
+                self.image_data,
+                lambda tile: tile,
+                sigmas=[2],
+                memmap=self.memmap,
+                workers=self.workers,
+                timer=self.timer,
             )
 
-    def tonemap(self, image_data=None, b: float = 0.25, threshold: float = None):
+        self.pyramid = None
+        if pyramid:
+            with self.timer.stage("pyramid"):
+                self.build_pyramid()
+        self.shared_image = None
+        self.shared_frame = None
+        self.shared_pyramid = None
+
+    def __getstate__(self):
+        """This is called before pickling (for worker processes)."""
+        state = self.__dict__.copy()
+        state.pop("hdu", None)
+        if self.shared_image is not None:  # workers read the image from shared memory
+            del state["image_data"]
+            del state["frame_data"]
+            state["pyramid"] = None
+        return state
+
+    def share_image(self):
+        """
+        Share the (preprocessed) image, the image for frames and the pyramid with worker processes.
+        The image is copied only once to shared memory, a memory-mapped image is not copied (the workers map the
+        same file). After this, pickling the object only sends the names of the shared images.
+        """
+        if self.shared_image is None:
+            frame_data = self.frame_data
+            self.shared_image = share(self.image_data)
+            weakref.finalize(self, self.shared_image.release)
+            if frame_data is not self.image_data:
+                self.shared_frame = share(frame_data)
+                weakref.finalize(self, self.shared_frame.release)
+            self.image_data = self.shared_image.array
+            self.frame_data = self.image_data if self.shared_frame is None else self.shared_frame.array
+            if self.pyramid is not None:
+                self.shared_pyramid = [share(level) for level in self.pyramid[1:]]
+                self.pyramid = [self.frame_data] + [level.array for level in self.shared_pyramid]
+                for level in self.shared_pyramid:
+                    weakref.finalize(self, level.release)
+        return self
+
+    def attach_shared(self):
+        """
+        Read the image and pyramid from shared memory (in a worker process).
+        """
+        self.image_data = self.shared_image.array
+        self.frame_data = self.image_data if self.shared_frame is None else self.shared_frame.array
+        if self.shared_pyramid is not None:
+            self.pyramid = [self.frame_data] + [level.array for level in self.shared_pyramid]
+        return self
+
+    def build_pyramid(self, min_size: int = 256):
+        """
+        Build a multi-resolution pyramid of the image for frames.
+        Every level is the previous level reduced by 2x2 blocks, ignoring NaN pixels.
+        Levels of a memory-mapped image are memory-mapped too.
+        ------------------------------------------------------------
+        :param min_size: smallest axis size of the coarsest level
+        """
+        self.pyramid = [self.frame_data]
+        while min(self.pyramid[-1].shape) // 2 >= min_size:
+            level = self.pyramid[-1]
+            ny, nx = level.shape[0] // 2, level.shape[1] // 2
+            if isinstance(level, np.memmap):
+                reduced = new_memmap((ny, nx), level.dtype)
+            else:
+                reduced = np.empty((ny, nx), dtype=level.dtype)
+            rows = block_rows((ny, nx))
+            for start, stop, _, _ in row_blocks(ny, rows):
+                blocks = level[start * 2 : stop * 2, : nx * 2].reshape(stop - start, 2, nx, 2)
+                reduced[start:stop] = np.nanmean(blocks, axis=(1, 3))
+            self.pyramid.append(reduced)
+        if self.verbose:
+            print(f"Built image pyramid with {len(self.pyramid)} levels")
+        return self
+
+    def pyramid_level(self, size: float = None, resolution: float = None):
+        """
+        Coarsest pyramid level that still has enough pixels for the output resolution.
+        ------------------------------------------------------------
+        :param size: cutout size in pixels (of the full resolution image)
+        :param resolution: output size in pixels along the same axis
+        :return: pyramid level (0 is the full resolution image)
+        """
+        level = 0
+        if self.pyramid is not None:
+            while level + 1 < len(self.pyramid) and size / 2 ** (level + 1) >= resolution:
+                level += 1
+        return level
+
+    def tonemap(
+        self, image_data=None, b: float = 0.25, threshold: float = None, maxima: tuple = None, dtype=np.float32
+    ):
         """
         Tonemap the image based on dynamic range. This enables both diffuse and point structures to be clearly visible.
         Works best on unsigned data for now. Scaling both negative and positive is a bit experimental.
         This mapping is based on http://citeseerx.ist.psu.edu/viewdoc/download?doi=10.1.1.219.7383&rep=rep1&type=pdf
+        The image is transformed in chunks into the output array, so the temporaries are small and the peak memory is
+        about the input and the output. In float32 the result is within 1e-6 of the float64 transfer function
+        (relative to the maximum of the output).
         :param image_data: image data
         :param b: smoothing param
         :param threshold: threshold for positive and residual components
+        :param maxima: maxima of the positive and residual components of the whole image, when image_data is a part
+        :param dtype: dtype of the computation and the output
         :return transformed data
         """
         if threshold is None:
             threshold = 0
-        data_pos = np.where(image_data > threshold, image_data, np.nan)
-        data_res = np.where(image_data < threshold, image_data, np.nan)
-        data_pos_tm = (
-            (np.nanmax(data_pos) * 0.01 / np.log10(np.nanmax(data_pos) + 1))
-            * (np.log10(data_pos + 1))
-            / (np.log10(2 + ((data_pos / np.nanmax(data_pos)) ** (np.log10(b) / np.log10(0.5))) * 8))
-        )
-        data_res_tm = (
-            (np.nanmax(data_res) * 0.01 / np.log10(np.nanmax(data_res) + 1))
-            * (np.log10(data_res + 1))
-            / (np.log10(2 + ((data_res / np.nanmax(data_res)) ** (np.log10(b) / np.log10(0.5))) * 8))
-        )
-        data_tm = np.where(image_data > threshold, np.sqrt(data_pos_tm), -1 * np.sqrt(np.abs(data_res_tm)))
+        data_tm = np.array(image_data, dtype=dtype, order="C")
+        if maxima is None:
+            maxima = tonemap_maxima(data_tm, threshold=threshold, workers=1)
+        max_pos, max_res = dtype(maxima[0]), dtype(maxima[1])
+        power = np.log10(b) / np.log10(0.5)
+
+        def transfer(data, maximum):
+            # (M * 0.01 / log10(M + 1)) * log10(x + 1) / log10(2 + (x / M) ** power * 8), with log1p for small x
+            scaled = data / maximum
+            scaled **= power
+            scaled *= 8
+            scaled += 2
+            np.log10(scaled, out=scaled)
+            data = np.log1p(data)
+            data *= maximum * dtype(0.01) / np.log1p(maximum)
+            data /= scaled
+            return data
+
+        flat = data_tm.reshape(-1)
+        with np.errstate(all="ignore"):
+            for start in range(0, flat.size, TONEMAP_CHUNK):
+                data = flat[start : start + TONEMAP_CHUNK]
+                data_pos = np.sqrt(transfer(data, max_pos))
+                data_res = -np.sqrt(np.abs(transfer(data, max_res)))
+                data[...] = np.where(data > threshold, data_pos, np.where(data < threshold, data_res, np.nan))
         return data_tm
 
     def imaging(
@@ -155,7 +309,7 @@ class ImagingLofar:
         """
 
         if image_data is None:
-            image_data = self.image_data
+            image_data = self.frame_data
         if wcs is None:
             wcs = self.wcs
         if dpi is None:
@@ -165,12 +319,72 @@ class ImagingLofar:
         else:
             h = 9
             w = 16
-        plt.figure(figsize=(h, w))
-        plt.subplot(projection=wcs)
+        if imsize is None:
+            imsize = 1
+        with self.timer.stage("norm"):
+            image_data, norm = self.prepare_frame(image_data=image_data, imsize=imsize)
+        with self.timer.stage("draw"):
+            plt.figure(figsize=(h, w))
+            plt.subplot(projection=wcs)
+            plt.imshow(image_data, norm=norm, origin="lower", cmap=cmap)
+            if text:
+                plt.annotate(
+                    text=text,
+                    xy=(0, 0),
+                    xytext=(0, 0),
+                    va="top",
+                    ha="left",
+                    fontsize=20,
+                    bbox=dict(facecolor="white", alpha=1),
+                )
+            elif ra and dec and imsize > 0.1:
+                plt.annotate(
+                    text=f"RA: {round(ra, 5)}\nDEC: {round(dec, 5)}",
+                    xy=(0, 0),
+                    xytext=(0, 0),
+                    va="top",
+                    ha="left",
+                    fontsize=10,
+                    bbox=dict(facecolor="white", alpha=0.7),
+                )
+            plt.xlabel("Galactic Longitude")
+            plt.ylabel("Galactic Latitude")
+            plt.grid(False)
+            plt.axis("off")
+            plt.tight_layout()
+            plt.subplots_adjust(left=0.0, bottom=0.0, top=1.0, right=1.0)
+        if save:
+            with self.timer.stage("save"):  # matplotlib rasterizes the figure while saving
+                plt.savefig(
+                    f"{self.image_directory}/{image_name}",
+                    bbox_inches="tight",
+                    dpi=dpi,
+                    facecolor="black",
+                    edgecolor="black",
+                )
+                plt.close()
+        else:
+            plt.show()
+        if self.verbose:
+            print(f"You can now find your image in '{self.image_directory}/{image_name}'")
+
+        return self
+
+    def prepare_frame(self, image_data=None, imsize: float = None):
+        """
+        Prepare image data and colour normalisation for one image.
+        This is shared between imaging() and the direct colormap renderer.
+        ------------------------------------------------------------
+        :param image_data: the image data (in numpy array)
+        :param imsize: image size in degrees
+        :return: image data to colour and matplotlib norm
+        """
+        if image_data is None:
+            image_data = self.frame_data
         if imsize is None:
             imsize = 1
         if "cutout" in self.fits_file:
-            plt.imshow(image_data, origin="lower", cmap=cmap, vmin=self.vmin * 2)
+            norm = Normalize(vmin=self.vmin * 2, vmax=np.nanmax(image_data))
         else:
             # HIGH RES VIDEO:
             if self.zoom_effect:
@@ -180,81 +394,158 @@ class ImagingLofar:
                     vmax /= max(imsize, 0.2)
                 if imsize < 0.1:
                     vmin += imsize / 100 * (0.1 / imsize) ** 1.35
-                image_data = gaussian_filter(image_data, sigma=2)
+                norm = SymLogNorm(linthresh=vmin * 20, vmin=self.vmin / 1.4, vmax=vmax)
+            else:
+                image_data = np.clip(image_data, a_min=None, a_max=self.vmax)
+                norm = LogNorm(vmin=self.vmin / 1.4, vmax=self.vmax)
+        return image_data, norm
 
-                plt.imshow(
-                    image_data,
-                    norm=SymLogNorm(linthresh=vmin * 20, vmin=self.vmin / 1.4, vmax=vmax),
-                    origin="lower",
-                    cmap=cmap,
-                )
+    def render_rgb(
+        self,
+        image_data=None,
+        imsize: float = None,
+        cmap: str = "CMRmap",
+        frame_size: tuple = (1920, 1080),
+        lut_size: int = 256,
+    ):
+        """
+        Render image data directly to an RGB buffer of exact size, without pyplot.
+        Uses the same norm as imaging(), the colours come from a precomputed lookup table.
+        ------------------------------------------------------------
+        :param image_data: the image data (in numpy array)
+        :param imsize: image size in degrees
+        :param cmap: cmap of your image
+        :param frame_size: output size in pixels (width, height)
+        :param lut_size: number of colours in the lookup table (256 or 65536)
+        :return: RGB image as uint8 array with shape (height, width, 3)
+        """
+        with self.timer.stage("norm"):
+            image_data, norm = self.prepare_frame(image_data=image_data, imsize=imsize)
+            width, height = frame_size
+            # nearest neighbour sampling on pixel centres, flipped for origin="lower"
+            rows = ((np.arange(height) + 0.5) * image_data.shape[0] / height).astype(int)[::-1]
+            cols = ((np.arange(width) + 0.5) * image_data.shape[1] / width).astype(int)
+            sampled = np.asarray(image_data)[rows[:, None], cols[None, :]]
+            return ColormapLUT.get(cmap, lut_size)(norm(sampled))
+
+    def render_agg(
+        self,
+        image_data=None,
+        imsize: float = None,
+        cmap: str = "CMRmap",
+        frame_size: tuple = (1920, 1080),
+        text: str = None,
+        ra=None,
+        dec=None,
+        dpi: int = 100,
+    ):
+        """
+        Render image data with an explicit Figure and Agg canvas to an RGB buffer of exact size.
+        No pyplot state is used, so this can be called from many threads at once.
+        ------------------------------------------------------------
+        :param image_data: the image data (in numpy array)
+        :param imsize: image size in degrees
+        :param cmap: cmap of your image
+        :param frame_size: output size in pixels (width, height)
+        :param text: text in the left down corner of your image
+        :param ra: right ascension
+        :param dec: declination
+        :param dpi: dots per inch (only scales the text)
+        :return: RGB image as uint8 array with shape (height, width, 3)
+        """
+        if imsize is None:
+            imsize = 1
+        with self.timer.stage("norm"):
+            image_data, norm = self.prepare_frame(image_data=image_data, imsize=imsize)
+        with self.timer.stage("draw"):
+            width, height = frame_size
+            fig = Figure(figsize=(width / dpi, height / dpi), dpi=dpi, facecolor="black")
+            canvas = FigureCanvasAgg(fig)
+            ax = fig.add_axes([0, 0, 1, 1])
+            ax.imshow(image_data, norm=norm, origin="lower", cmap=cmap, aspect="auto")
+            if text:
+                label, fontsize, alpha = text, 20, 1
+            elif ra and dec and imsize > 0.1:
+                label, fontsize, alpha = f"RA: {round(ra, 5)}\nDEC: {round(dec, 5)}", 10, 0.7
             else:
-                plt.imshow(
-                    np.clip(image_data, a_min=None, a_max=self.vmax),
-                    norm=LogNorm(vmin=self.vmin / 1.4, vmax=self.vmax),
-                    origin="lower",
-                    cmap=cmap,
+                label = None
+            if label:
+                ax.annotate(
+                    text=label,
+                    xy=(0, 0),
+                    xycoords="axes fraction",
+                    xytext=(4, 4),
+                    textcoords="offset points",
+                    va="bottom",
+                    ha="left",
+                    fontsize=fontsize,
+                    bbox=dict(facecolor="white", alpha=alpha),
                 )
-        if text:
-            plt.annotate(
-                text=text,
-                xy=(0, 0),
-                xytext=(0, 0),
-                va="top",
-                ha="left",
-                fontsize=20,
-                bbox=dict(facecolor="white", alpha=1),
-            )
-        elif ra and dec and imsize > 0.1:
-            plt.annotate(
-                text=f"RA: {round(ra, 5)}\nDEC: {round(dec, 5)}",
-                xy=(0, 0),
-                xytext=(0, 0),
-                va="top",
-                ha="left",
-                fontsize=10,
-                bbox=dict(facecolor="white", alpha=0.7),
-            )
-        plt.xlabel("Galactic Longitude")
-        plt.ylabel("Galactic Latitude")
-        plt.grid(False)
-        plt.axis("off")
-        plt.tight_layout()
-        plt.subplots_adjust(left=0.0, bottom=0.0, top=1.0, right=1.0)
-        if save:
-            plt.savefig(
-                f"{self.image_directory}/{image_name}",
-                bbox_inches="tight",
-                dpi=dpi,
-                facecolor="black",
-                edgecolor="black",
-            )
-            plt.close()
-        else:
-            plt.show()
-        if self.verbose:
-            print(f"You can now find your image in '{self.image_directory}/{image_name}'")
-
-        return self
+            ax.axis("off")
+            canvas.draw()
+            return np.asarray(canvas.buffer_rgba())[..., :3].copy()
 
-    def make_cutout(self, pos: tuple = None, size: tuple = (1000, 1000)):
+    def make_cutout(
+        self,
+        pos: tuple = None,
+        size: tuple = (1000, 1000),
+        level: int = 0,
+        with_wcs: bool = True,
+        frame: bool = True,
+    ):
         """
         Make cutout from your image.
+        The cutout is sliced directly from the image and padded with NaN, with the same pixels as Cutout2D
+        in partial mode. The wcs of the cutout is only made when it is needed for drawing axes.
         ------------------------------------------------------------
-        :param pos: position in degrees (RA, DEC)
-        :param size: size of your image in pixel size
-        :return: cutout data and cutout wcs (coordinate system)
+        :param pos: position in pixels (x, y)
+        :param size: size of your image in pixel size (y, x)
+        :param level: pyramid level to cut from (pos and size stay in full resolution pixels)
+        :param with_wcs: also make the wcs of the cutout
+        :param frame: cut from the image for frames (with the zoom effect smoothing), otherwise from the preprocessed
+                      image (only level 0)
+        :return: cutout data and cutout wcs (coordinate system, None if with_wcs is False)
         """
         if self.verbose:
             print(f"We are now making a cutout from your image.")
-        cutout = Cutout2D(data=self.image_data, position=pos, size=size, wcs=self.wcs, mode="partial")
+        if np.isscalar(size):
+            size = (size, size)
+        size = tuple(int(s) for s in size)
+        image_data, image_wcs = (self.frame_data if frame else self.image_data), self.wcs
+        if level > 0:
+            factor = 2**level
+            image_data = self.pyramid[level]
+            pos = ((pos[0] + 0.5) / factor - 0.5, (pos[1] + 0.5) / factor - 0.5)
+            size = tuple(int(s / factor) | 1 for s in size)  # keep an odd size
+        x_min = int(np.ceil(pos[0] - size[1] / 2))
+        y_min = int(np.ceil(pos[1] - size[0] / 2))
+        x_start, x_end = max(x_min, 0), min(x_min + size[1], image_data.shape[1])
+        y_start, y_end = max(y_min, 0), min(y_min + size[0], image_data.shape[0])
+        if (x_start, y_start, x_end, y_end) == (x_min, y_min, x_min + size[1], y_min + size[0]):
+            cutout_data = image_data[y_start:y_end, x_start:x_end]
+        else:
+            cutout_data = np.full(size, np.nan, dtype=image_data.dtype)
+            if x_start < x_end and y_start < y_end:
+                cutout_data[y_start - y_min : y_end - y_min, x_start - x_min : x_end - x_min] = image_data[
+                    y_start:y_end, x_start:x_end
+                ]
+        cutout_wcs = None
+        if with_wcs:
+            if level > 0:
+                image_wcs = image_wcs.slice((np.s_[::factor], np.s_[::factor]))
+            cutout_wcs = image_wcs.deepcopy()
+            cutout_wcs.wcs.crpix -= (x_min, y_min)
+            cutout_wcs.pixel_shape = (size[1], size[0])
+            if cutout_wcs.sip is not None:
+                sip = cutout_wcs.sip
+                cutout_wcs.sip = Sip(sip.a, sip.b, sip.ap, sip.bp, sip.crpix - (x_min, y_min))
         if self.verbose:
             print(f"Cutout finished")
-        return cutout.data, cutout.wcs
+        return cutout_data, cutout_wcs
 
     def to_pixel(self, ra: float = None, dec: float = None):
         """
-        To pixel position from RA and DEC
+        To pixel position from RA and DEC (also works for arrays of positions)
         ------------------------------------------------------------
         :param ra: Right ascension (degrees)
         :param dec: Declination (degrees)
@@ -276,6 +567,7 @@ class ImagingLofar:
         cmap: str = "CMRmap",
         text: str = None,
         imsize: float = None,
+        pix: tuple = None,
     ):
         """
         Make image cutout and make image
@@ -288,25 +580,29 @@ class ImagingLofar:
         :param cmap: cmap of your image
         :param text: text in the left down corner of your image
         :param imsize: image size in degrees
+        :param pix: pixel position of pos, when it is already known
         """
         ra, dec = pos
-        pix_x, pix_y = self.to_pixel(ra, dec)
+        with self.timer.stage("wcs"):
+            pix_x, pix_y = pix if pix is not None else self.to_pixel(ra, dec)
         if size:
             if size[0] < 2 and size[0] < 2:
                 size = (
-                    np.int(imsize / np.max(self.wcs.pixel_scale_matrix)),
-                    np.int(imsize / np.max(self.wcs.pixel_scale_matrix)),
+                    np.int(imsize / self.pixel_scale),
+                    np.int(imsize / self.pixel_scale),
                 )
         else:
             size = (
-                np.int(imsize / np.max(self.wcs.pixel_scale_matrix)),
-                np.int(imsize / np.max(self.wcs.pixel_scale_matrix)),
+                np.int(imsize / self.pixel_scale),
+                np.int(imsize / self.pixel_scale),
             )
-        image_data, wcs = self.make_cutout((int(pix_x), int(pix_y)), size)
-        if self.verbose:
-            print(f"Let's now image '{image_name.replace('_', ' ').replace('.png', '').replace('.', ' ').title()}'")
         if size[0] < dpi:
             dpi = size[0]
+        level = self.pyramid_level(size[1], 9 * dpi)  # the figure is 9 inch wide
+        with self.timer.stage("cutout"):
+            image_data, wcs = self.make_cutout((int(pix_x), int(pix_y)), size, level=level)
+        if self.verbose:
+            print(f"Let's now image '{image_name.replace('_', ' ').replace('.png', '').replace('.', ' ').title()}'")
         self.imaging(
             image_data=image_data,
             wcs=wcs,
@@ -321,32 +617,224 @@ class ImagingLofar:
         )
         return self
 
-    def make_fits(self, pos: tuple = None, size: tuple = (1000, 1000), filename: str = None, imsize: float = None):
+    def poster_size(self, image_data=None, dpi: int = 3000):
+        """
+        Size of the image that imaging() saves: the image fitted in a figure of 9 x 16 inch.
+        ------------------------------------------------------------
+        :param image_data: the image data (in numpy array)
+        :param dpi: dots per inch
+        :return: output size in pixels (width, height)
+        """
+        if image_data is None:
+            image_data = self.frame_data
+        scale = min(9 * dpi / image_data.shape[1], 16 * dpi / image_data.shape[0])
+        return max(int(round(image_data.shape[1] * scale)), 1), max(int(round(image_data.shape[0] * scale)), 1)
+
+    def poster_strips(
+        self,
+        image_data=None,
+        dpi: int = 3000,
+        cmap: str = "CMRmap",
+        imsize: float = None,
+        strip_pixels: int = 2**20,
+    ):
+        """
+        Strips of rows of the main image of the poster (see poster_image).
+        ------------------------------------------------------------
+        :param image_data: the image data (in numpy array)
+        :param dpi: dots per inch, the image fits in 9 x 16 inch like with imaging()
+        :param cmap: cmap of your image
+        :param imsize: image size in degrees
+        :param strip_pixels: number of output pixels per strip
+        :return: output size (width, height), first row of every strip and a function that makes the RGB strip of a
+                 first row
+        """
+        if image_data is None:
+            image_data = self.frame_data  # like imaging(), with the zoom effect smoothing
+        width, height = self.poster_size(image_data, dpi)
+        # nearest neighbour sampling on pixel centres, flipped for origin="lower"
+        rows = ((np.arange(height) + 0.5) * image_data.shape[0] / height).astype(int)[::-1]
+        cols = ((np.arange(width) + 0.5) * image_data.shape[1] / width).astype(int)
+        # one norm for all strips, from a sample of at most about 4 million pixels
+        step = max(int(np.sqrt(image_data.shape[0] * image_data.shape[1] / 2**22)), 1)
+        _, norm = self.prepare_frame(image_data=np.asarray(image_data[::step, ::step]), imsize=imsize)
+        colormap = ColormapLUT.get(cmap)
+        strip_rows = max(strip_pixels // width, 1)
+
+        def make_strip(start):
+            with self.timer.stage("cutout"):
+                sampled = np.asarray(image_data[rows[start : start + strip_rows]])[:, cols]
+            with self.timer.stage("norm"):
+                sampled, _ = self.prepare_frame(image_data=sampled, imsize=imsize)
+                normed = norm(sampled)
+            with self.timer.stage("draw"):
+                return colormap(normed)
+
+        return (width, height), list(range(0, height, strip_rows)), make_strip
+
+    def poster_image(
+        self,
+        image_data=None,
+        image_name: str = "main.png",
+        dpi: int = 3000,
+        cmap: str = "CMRmap",
+        imsize: float = None,
+        strip_pixels: int = 2**20,
+        compress_level: int = 6,
+        workers: int = None,
+    ):
+        """
+        Make a large image (the main image of the poster) in strips of rows that are streamed to a png file.
+        The strips are sampled from the image with nearest neighbour (like imshow when it enlarges an image) and coloured
+        with the norm of imaging() and a lookup table, in a thread pool. The memory is bounded by a few strips,
+        instead of the whole figure canvas of matplotlib.
+        ------------------------------------------------------------
+        :param image_data: the image data (in numpy array)
+        :param image_name: name of your output image
+        :param dpi: dots per inch, the image fits in 9 x 16 inch like with imaging()
+        :param cmap: cmap of your image
+        :param imsize: image size in degrees
+        :param strip_pixels: number of output pixels per strip
+        :param compress_level: png compression level (0-9)
+        :param workers: number of threads for the strips (default: self.workers)
+        """
+        workers = workers or self.workers
+        (width, height), starts, make_strip = self.poster_strips(image_data, dpi, cmap, imsize, strip_pixels)
+        writer = PNGStream(f"{self.image_directory}/{image_name}", width, height, compress_level=compress_level)
+
+        def compress_strip(start):
+            strip = make_strip(start)
+            with self.timer.stage("encode"):
+                return writer.compress(strip)
+
+        try:
+            with ThreadPool(workers) as p:
+                for batch in range(0, len(starts), workers):  # a few strips at once, to bound the memory
+                    for compressed in p.map(compress_strip, starts[batch : batch + workers]):
+                        with self.timer.stage("save"):
+                            writer.write(compressed)
+        finally:
+            writer.close()
+        if self.verbose:
+            print(f"You can now find your image in '{self.image_directory}/{image_name}' ({width} x {height} pixels)")
+        return self
+
+    def image_cutouts(
+        self,
+        positions=None,
+        dpi: float = 1000,
+        cmap: str = "CMRmap",
+        image_name: str = "cutout_{n}.png",
+        main: dict = None,
+        imsize=None,
+        fits_name: str = None,
+    ):
+        """
+        Make the image cutouts of a catalogue in a process pool that shares the (preprocessed) image.
+        All pixel positions are computed at once. Meanwhile this process can make another image (the main image).
+        ------------------------------------------------------------
+        :param positions: array with rows (RA, DEC, size_x, size_y), the sizes in pixels (or NaN for the default)
+        :param dpi: dots per inch
+        :param cmap: cmap of your images
+        :param image_name: name of the output images, with {n} for the row number and {ra} and {dec}
+        :param main: keyword arguments of poster_image() for the main image, which is made at the same time in this process
+        :param imsize: image size in degrees, one for all cutouts or one per row (used when there is no size)
+        :param fits_name: name of output fits images like image_name, to also make a fits file of every cutout
+        :return: row numbers of the cutouts that failed
+        """
+        positions = np.asarray(positions, dtype=float).reshape(-1, 4)
+        imsizes = np.broadcast_to(np.asarray(np.nan if imsize is None else imsize, dtype=float), len(positions))
+        with self.timer.stage("wcs"):
+            pixels = np.array(self.to_pixel(positions[:, 0], positions[:, 1])).T
+        inputs = []
+        for n, position in enumerate(positions):
+            names = dict(n=n, ra=float(position[0]), dec=float(position[1]))
+            kwargs = dict(
+                pos=tuple(position[0:2]),
+                size=tuple(position[2:4]) if position[3] == position[3] else None,
+                dpi=dpi,
+                image_name=image_name.format(**names),
+                save=True,
+                cmap=cmap,
+                imsize=float(imsizes[n]) if imsizes[n] == imsizes[n] else None,
+                pix=tuple(pixels[n]),
+            )
+            fits_kwargs = None
+            if fits_name:
+                fits_kwargs = dict(
+                    pos=kwargs["pos"], filename=fits_name.format(**names), imsize=kwargs["imsize"], pix=kwargs["pix"]
+                )
+                if kwargs["size"] is not None or kwargs["imsize"] is not None:
+                    fits_kwargs["size"] = kwargs["size"]  # same size as the png, not the default size of make_fits
+            inputs.append((n, kwargs, fits_kwargs))
+        failed = []
+        if self.workers > 1 and len(inputs) > 1:
+            # with a main image, one worker makes the main image and the others make the cutouts
+            processes = self.workers - 1 if main else self.workers
+            print(f"Making {len(inputs)} cutouts with {processes} processes")
+            self.share_image()
+            with Pool(processes, initializer=init_worker, initargs=(self,)) as p:
+                results = p.imap_unordered(cutout_worker, inputs)  # the workers start right away
+                if main:
+                    self.poster_image(**main, workers=1)
+                for n, error, timing in results:
+                    self.timer.add(timing)
+                    if error:
+                        failed.append(n)
+                        print(colored(f"Cutout {n} failed:\n{error}", "red"))
+        else:
+            if main:
+                self.poster_image(**main)
+            for n, kwargs, fits_kwargs in inputs:
+                try:
+                    with self.timer.frame(n):
+                        self.image_cutout(**kwargs)
+                        if fits_kwargs:
+                            self.make_fits(**fits_kwargs)
+                except Exception as error:
+                    failed.append(n)
+                    print(colored(f"Cutout {n} failed: {error}", "red"))
+        if failed:
+            print(colored(f"{len(failed)} cutouts failed: {sorted(failed)}", "red"))
+        return sorted(failed)
+
+    def make_fits(
+        self,
+        pos: tuple = None,
+        size: tuple = (1000, 1000),
+        filename: str = None,
+        imsize: float = None,
+        pix: tuple = None,
+    ):
         """
         Make image cutout and make fitsfile
+        The cutout gets a new hdu, the hdu of the image is not changed, so cutouts can be made at the same time.
         ------------------------------------------------------------
         :param pos: position in degrees (RA, DEC)
         :param size: size of your image in pixel size
         :param filename: name of output fits image
         :param imsize: image size in degrees
+        :param pix: pixel position of pos, when it is already known
         """
         ra, dec = pos
-        pix_x, pix_y = self.to_pixel(ra, dec)
+        pix_x, pix_y = pix if pix is not None else self.to_pixel(ra, dec)
         if size:
             if size[0] < 2 and size[0] < 2:
                 size = (
-                    np.int(imsize / np.max(self.wcs.pixel_scale_matrix)),
-                    np.int(imsize / np.max(self.wcs.pixel_scale_matrix)),
+                    np.int(imsize / self.pixel_scale),
+                    np.int(imsize / self.pixel_scale),
                 )
         else:
             size = (
-                np.int(imsize / np.max(self.wcs.pixel_scale_matrix)),
-                np.int(imsize / np.max(self.wcs.pixel_scale_matrix)),
+                np.int(imsize / self.pixel_scale),
+                np.int(imsize / self.pixel_scale),
             )
-        image_data, wcs = self.make_cutout((pix_x, pix_y), size)
-        self.hdu.data = image_data
-        self.hdu.header.update(wcs.to_header())
-        self.hdu.writeto(f"{self.image_directory}/{filename}", overwrite=True)
+        image_data, wcs = self.make_cutout((pix_x, pix_y), size, frame=False)
+        header = self.header.copy()
+        header.update(wcs.to_header())
+        fits.PrimaryHDU(data=np.asarray(image_data), header=header).writeto(
+            f"{self.image_directory}/{filename}", overwrite=True
+        )
         return self
 
 
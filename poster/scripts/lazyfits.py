@@ -0,0 +1,125 @@
+import os
+import tempfile
+import weakref
+
+import numpy as np
+
+__all__ = ["LazyImage", "image_hdu", "row_blocks", "block_rows", "nanstd", "new_memmap"]
+
+BLOCK_PIXELS = 2**24  # pixels per block (64 MB in float32)
+
+
+def image_hdu(hdul):
+    """
+    First HDU with an image, which is the primary HDU for normal fits files and the first extension for
+    tile-compressed fits files (their primary HDU is empty).
+    ------------------------------------------------------------
+    :param hdul: opened fits file (HDUList)
+    :return: image HDU
+    """
+    for hdu in hdul:
+        if hdu.is_image and hdu.header.get("NAXIS", 0) >= 2:
+            return hdu
+    raise ValueError("The fits file has no image.")
+
+
+class LazyImage:
+    """
+    LazyImage is a 2D view on the image of a fits HDU, which reads (and decompresses) only the part that is requested.
+    Degenerate axes (frequency, stokes) are peeled off by taking their first element.
+    This works for uncompressed fits files (memory-mapped) and tile-compressed fits files (only the needed tiles).
+    Before astropy 5.3 tile-compressed images have no section, then the whole image is decompressed on first use.
+    """
+
+    def __init__(self, hdu):
+        """
+        :param hdu: image HDU
+        """
+        self.hdu = hdu
+        self.index = (0,) * (len(hdu.shape) - 2)
+        self.shape = tuple(hdu.shape[-2:])
+        self.ndim = 2
+        self.dtype = self[:1, :1].dtype
+
+    def __getitem__(self, item):
+        if not isinstance(item, tuple):
+            item = (item,)
+        if hasattr(self.hdu, "section"):
+            return np.asarray(self.hdu.section[self.index + item])
+        return np.asarray(self.hdu.data[self.index + item])
+
+    def __array__(self, dtype=None):
+        return np.asarray(self[:, :], dtype=dtype)
+
+    @property
+    def nbytes(self):
+        return self.shape[0] * self.shape[1] * self.dtype.itemsize
+
+
+def block_rows(shape, block_pixels: int = BLOCK_PIXELS):
+    """
+    Number of image rows in one block.
+    ------------------------------------------------------------
+    :param shape: image shape
+    :param block_pixels: maximum number of pixels in one block
+    :return: number of rows
+    """
+    return max(1, block_pixels // max(shape[1], 1))
+
+
+def row_blocks(n_rows: int, rows: int, halo: int = 0):
+    """
+    Split the rows of an image in blocks, with an overlap (halo) on both sides that is clipped at the image edges.
+    ------------------------------------------------------------
+    :param n_rows: number of image rows
+    :param rows: rows per block
+    :param halo: extra rows on both sides of a block
+    :return: generator of (start, stop, halo start, halo stop)
+    """
+    for start in range(0, n_rows, rows):
+        stop = min(start + rows, n_rows)
+        yield start, stop, max(start - halo, 0), min(stop + halo, n_rows)
+
+
+def nanstd(image, rows: int = None):
+    """
+    Standard deviation ignoring NaN pixels, reading the image in blocks of rows (two passes, in float64).
+    ------------------------------------------------------------
+    :param image: image (numpy array, memmap or LazyImage)
+    :param rows: rows per block
+    :return: standard deviation
+    """
+    rows = rows or block_rows(image.shape)
+    count, total = 0, 0.0
+    for start, stop, _, _ in row_blocks(image.shape[0], rows):
+        block = np.asarray(image[start:stop], dtype=np.float64)
+        count += np.count_nonzero(~np.isnan(block))
+        total += np.nansum(block)
+    if count == 0:
+        return np.nan
+    mean, squares = total / count, 0.0
+    for start, stop, _, _ in row_blocks(image.shape[0], rows):
+        block = np.asarray(image[start:stop], dtype=np.float64)
+        squares += np.nansum((block - mean) ** 2)
+    return np.sqrt(squares / count)
+
+
+def new_memmap(shape, dtype, directory: str = None):
+    """
+    New array that is memory-mapped to a temporary .npy file, which is removed when the array is not used anymore.
+    Other processes can map the same file with np.load(filename, mmap_mode="r").
+    ------------------------------------------------------------
+    :param shape: array shape
+    :param dtype: array dtype
+    :param directory: directory of the file (default: the temporary directory)
+    :return: memmap
+    """
+    fd, filename = tempfile.mkstemp(suffix=".npy", dir=directory)
+    os.close(fd)
+    array = np.lib.format.open_memmap(filename, mode="w+", dtype=dtype, shape=tuple(shape))
+    weakref.finalize(array, os.remove, filename)
+    return array
+
+
+if __name__ == "__main__":
+    print("Cannot call script directly.")
@@ -0,0 +1,99 @@
+import os
+import struct
+import zlib
+
+import numpy as np
+
+__all__ = ["PNGStream", "compress_strip"]
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+class PNGStream:
+    """
+    PNGStream writes an RGB png file in strips of rows, so the whole image is never in memory.
+    Every strip is deflated on its own (compress, which can run in threads) and the strips are written in order (write).
+    The strips are joined into one zlib stream like pigz does: without a final block, byte aligned with a sync flush.
+    """
+
+    def __init__(self, filename: str = "main.png", width: int = None, height: int = None, compress_level: int = 6):
+        """
+        :param filename: output png file
+        :param width: image width in pixels
+        :param height: image height in pixels
+        :param compress_level: zlib compression level (0-9)
+        """
+        self.filename = filename
+        self.width = width
+        self.height = height
+        self.compress_level = compress_level
+        self.rows = 0
+        self.adler = zlib.adler32(b"")
+        self.temp_file = f"{filename}.{os.getpid()}.tmp"
+        self.file = open(self.temp_file, "wb")
+        self.file.write(PNG_SIGNATURE)
+        self.chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))  # 8 bit RGB
+        self.chunk(b"IDAT", b"\x78\x9c")  # zlib header
+
+    def chunk(self, name: bytes = None, data: bytes = b""):
+        self.file.write(struct.pack(">I", len(data)) + name + data)
+        self.file.write(struct.pack(">I", zlib.crc32(data, zlib.crc32(name)) & 0xFFFFFFFF))
+
+    def compress(self, strip):
+        """
+        Filter and deflate a strip of rows (see compress_strip).
+        ------------------------------------------------------------
+        :param strip: RGB image as uint8 array with shape (rows, width, 3)
+        :return: filtered rows and deflated data, for write
+        """
+        return compress_strip(strip, self.compress_level)
+
+    def write(self, compressed):
+        """
+        Write a compressed strip, strips should be written from the top of the image.
+        ------------------------------------------------------------
+        :param compressed: output of compress
+        """
+        filtered, data = compressed
+        self.adler = zlib.adler32(filtered, self.adler)
+        self.rows += len(filtered) // (3 * self.width + 1)
+        self.chunk(b"IDAT", data)
+        return self
+
+    def close(self):
+        """
+        Finish the png file. The file gets its name only when all rows are written.
+        """
+        if self.file is None:
+            return
+        self.chunk(b"IDAT", zlib.compressobj(0, zlib.DEFLATED, -15).flush() + struct.pack(">I", self.adler))
+        self.chunk(b"IEND")
+        self.file.close()
+        self.file = None
+        if self.rows != self.height:
+            os.remove(self.temp_file)
+            raise ValueError(f"{self.filename} should have {self.height} rows, but {self.rows} rows were written.")
+        os.replace(self.temp_file, self.filename)
+
+
+def compress_strip(strip, compress_level: int = 6):
+    """
+    Filter and deflate a strip of rows of a png. The rows are filtered with the png 'Sub' filter
+    (the difference with the pixel on the left), which makes smooth images much smaller.
+    ------------------------------------------------------------
+    :param strip: RGB image as uint8 array with shape (rows, width, 3)
+    :param compress_level: zlib compression level (0-9)
+    :return: filtered rows and deflated data
+    """
+    rows = strip.reshape(len(strip), -1)
+    filtered = np.empty((len(rows), rows.shape[1] + 1), dtype=np.uint8)
+    filtered[:, 0] = 1  # filter type Sub
+    filtered[:, 1:4] = rows[:, :3]
+    np.subtract(rows[:, 3:], rows[:, :-3], out=filtered[:, 4:])
+    filtered = filtered.tobytes()
+    deflate = zlib.compressobj(compress_level, zlib.DEFLATED, -15)
+    return filtered, deflate.compress(filtered) + deflate.flush(zlib.Z_SYNC_FLUSH)
+
+
+if __name__ == "__main__":
+    print("Cannot call script directly.")
@@ -0,0 +1,117 @@
+import os
+from multiprocessing.dummy import Pool as ThreadPool
+
+import numpy as np
+from scipy.ndimage import gaussian_filter
+
+from poster.scripts.lazyfits import new_memmap, row_blocks
+from poster.scripts.timing import StageTimer
+
+__all__ = ["filter_radius", "tonemap_maxima", "preprocess"]
+
+TILE_SIZE = 2048  # tile size in pixels (without halo)
+
+
+def filter_radius(sigmas, truncate: float = 4.0):
+    """
+    Number of pixels that gaussian filters after each other look around a pixel (the halo of a tile).
+    ------------------------------------------------------------
+    :param sigmas: sigmas of the gaussian filters
+    :param truncate: truncate of scipy's gaussian_filter
+    :return: radius in pixels
+    """
+    return sum(int(truncate * float(sigma) + 0.5) for sigma in sigmas)
+
+
+def bands(image_data, tile_size: int = TILE_SIZE, halo: int = 0, timer=None):
+    """
+    Read the image in bands of rows (with halo rows), split in tiles along the columns.
+    Every row is read once, which matters for tile-compressed fits files that are compressed per row.
+    ------------------------------------------------------------
+    :param image_data: image (numpy array, memmap or LazyImage)
+    :param tile_size: tile size in pixels
+    :param halo: overlap of the tiles
+    :param timer: StageTimer for reading the bands (load stage)
+    :return: generator of (band, rows, list of columns), with rows and columns as (start, stop, halo start, halo stop)
+    """
+    timer = timer or StageTimer()
+    columns = list(row_blocks(image_data.shape[1], tile_size, halo))
+    for rows in row_blocks(image_data.shape[0], tile_size, halo):
+        with timer.stage("load"):
+            band = np.asarray(image_data[rows[2] : rows[3]])
+        yield band, rows, columns
+
+
+def tonemap_maxima(image_data, threshold: float = None, tile_size: int = TILE_SIZE, workers: int = None):
+    """
+    Maxima of the positive and residual components of the whole image, which the tonemap needs (reduction pass).
+    ------------------------------------------------------------
+    :param image_data: image (numpy array, memmap or LazyImage)
+    :param threshold: threshold for positive and residual components
+    :param tile_size: tile size in pixels
+    :param workers: number of threads (default: all cpu's)
+    :return: maximum of the positive component and maximum of the residual component (NaN when empty)
+    """
+    if threshold is None:
+        threshold = 0
+
+    def tile_maxima(tile):
+        pos, res = tile[tile > threshold], tile[tile < threshold]
+        return pos.max() if pos.size else None, res.max() if res.size else None
+
+    max_pos, max_res = [], []
+    with ThreadPool(workers or os.cpu_count()) as p:
+        for band, _, columns in bands(image_data, tile_size):
+            for pos, res in p.imap_unordered(tile_maxima, [band[:, start:stop] for start, stop, _, _ in columns]):
+                max_pos += [pos] if pos is not None else []
+                max_res += [res] if res is not None else []
+    return (max(max_pos) if max_pos else np.nan), (max(max_res) if max_res else np.nan)
+
+
+def preprocess(
+    image_data,
+    tonemap,
+    sigmas: list = None,
+    memmap: bool = False,
+    tile_size: int = TILE_SIZE,
+    workers: int = None,
+    timer=None,
+):
+    """
+    Tonemap and smooth the image in tiles, processed in a thread pool.
+    The tiles overlap by the radius of the gaussian filters, so the result is the same as for the full image at once.
+    The tonemap should use the maxima of the whole image (see tonemap_maxima).
+    ------------------------------------------------------------
+    :param image_data: image (numpy array, memmap or LazyImage)
+    :param tonemap: function that tonemaps a tile
+    :param sigmas: sigmas of the gaussian filters that are applied after each other
+    :param memmap: write the output to a memory-mapped temporary file instead of memory
+    :param tile_size: tile size in pixels
+    :param workers: number of threads (default: all cpu's)
+    :param timer: StageTimer for the tonemap and filter stages (summed over the tiles)
+    :return: preprocessed image
+    """
+    sigmas = sigmas or []
+    timer = timer or StageTimer()
+    dtype = tonemap(np.asarray(image_data[:1, :1])).dtype
+    output = new_memmap(image_data.shape, dtype) if memmap else np.empty(image_data.shape, dtype=dtype)
+
+    def process_tile(inputs):
+        tile, (y_min, y_max, y_halo, _), (x_min, x_max, x_halo, _) = inputs
+        with timer.stage("tonemap"):
+            tile = tonemap(tile)
+        with timer.stage("filter"):
+            for sigma in sigmas:
+                tile = gaussian_filter(tile, sigma=sigma)
+        output[y_min:y_max, x_min:x_max] = tile[y_min - y_halo : y_max - y_halo, x_min - x_halo : x_max - x_halo]
+
+    with ThreadPool(workers or os.cpu_count()) as p:
+        for band, rows, columns in bands(image_data, tile_size, filter_radius(sigmas), timer):
+            p.map(process_tile, [(band[:, column[2] : column[3]], rows, column) for column in columns])
+    if memmap:
+        output.flush()
+    return output
+
+
+if __name__ == "__main__":
+    print("Cannot call script directly.")
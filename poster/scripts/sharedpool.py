@@ -0,0 +1,125 @@
+import traceback
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+__all__ = ["SharedImage", "MappedImage", "share", "init_worker", "cutout_worker"]
+
+_image = None  # ImagingLofar instance of the current worker process
+
+
+class SharedImage:
+    """
+    SharedImage keeps an image in shared memory, so worker processes can read it without a copy.
+    Pickling only sends the name of the memory block, the shape and the dtype.
+    """
+
+    def __init__(self, image_data=None, name: str = None, shape: tuple = None, dtype: str = None):
+        """
+        :param image_data: image to copy in shared memory (only in the main process)
+        :param name: name of an existing shared memory block (to attach in a worker)
+        :param shape: image shape
+        :param dtype: image dtype
+        """
+        if image_data is not None:
+            self.shape, self.dtype = image_data.shape, np.dtype(image_data.dtype).str
+            self.shm = SharedMemory(create=True, size=max(image_data.nbytes, 1))
+            self.owner = True
+            self.array[...] = image_data
+        else:
+            self.shape, self.dtype = shape, dtype
+            self.shm = SharedMemory(name=name)
+            self.owner = False
+
+    @property
+    def array(self):
+        return np.ndarray(self.shape, dtype=self.dtype, buffer=self.shm.buf)
+
+    def __reduce__(self):
+        return self.__class__, (None, self.shm.name, self.shape, self.dtype)
+
+    def release(self):
+        """
+        Close the shared memory and remove it when this is the main process.
+        """
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+class MappedImage:
+    """
+    MappedImage shares an image that is already memory-mapped from a .npy file, workers map the same file.
+    Pickling only sends the file name, so nothing is copied.
+    """
+
+    def __init__(self, image_data=None, filename: str = None):
+        """
+        :param image_data: memory-mapped image (only in the main process)
+        :param filename: .npy file of the image (to map in a worker)
+        """
+        if image_data is not None:
+            self.filename = image_data.filename
+            self.image_data = image_data
+        else:
+            self.filename = filename
+            self.image_data = np.load(filename, mmap_mode="r")
+
+    @property
+    def array(self):
+        return self.image_data
+
+    def __reduce__(self):
+        return self.__class__, (None, self.filename)
+
+    def release(self):
+        """
+        The file is removed together with the memmap of the main process.
+        """
+        self.image_data = None
+
+
+def share(image_data):
+    """
+    Share an image with worker processes: memory-mapped images map the same file, others are copied in shared memory.
+    ------------------------------------------------------------
+    :param image_data: image
+    :return: MappedImage or SharedImage
+    """
+    if isinstance(image_data, np.memmap) and image_data.filename is not None:
+        return MappedImage(image_data)
+    return SharedImage(image_data)
+
+
+def init_worker(image):
+    """
+    Initialize a worker process with one ImagingLofar, reading the image from shared memory.
+    ------------------------------------------------------------
+    :param image: ImagingLofar instance
+    """
+    global _image
+    _image = image
+    _image.timer.as_worker()
+    _image.attach_shared()
+
+
+def cutout_worker(inputs):
+    """
+    Make one image cutout in a worker process.
+    ------------------------------------------------------------
+    :param inputs: cutout number, keyword arguments of image_cutout and of make_fits (None for no fits file)
+    :return: cutout number, traceback if the cutout failed (otherwise None) and the timing of the cutout
+    """
+    n, kwargs, fits_kwargs = inputs
+    try:
+        with _image.timer.frame(n):
+            _image.image_cutout(**kwargs)
+            if fits_kwargs:
+                _image.make_fits(**fits_kwargs)
+    except Exception:
+        return n, traceback.format_exc(), _image.timer.last()
+    return n, None, _image.timer.last()
+
+
+if __name__ == "__main__":
+    print("Cannot call script directly.")
@@ -0,0 +1,229 @@
+import json
+import resource
+import threading
+from contextlib import contextmanager
+from time import perf_counter
+
+import numpy as np
+
+__all__ = ["StageTimer", "peak_rss"]
+
+
+def peak_rss():
+    """
+    Peak resident memory of this process and its (finished) child processes.
+    ------------------------------------------------------------
+    :return: peak memory in MB
+    """
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return round(max(own, children) / 1e3, 1)  # ru_maxrss is in kB on Linux
+
+
+class StageTimer:
+    """
+    StageTimer records the wall time of the stages of the imaging (load, tonemap, filter, wcs, cutout, norm, draw,
+    resample, blend, save, encode). Stages inside a frame are collected per frame and every frame is written as a
+    JSON line.
+    The summary gives the p50 and p95 of every stage, the frames per second and the peak memory.
+    When no file is given, the timer does nothing, so the instrumentation costs nothing by default.
+    """
+
+    def __init__(self, path: str = None):
+        """
+        :param path: JSON-lines output file (None to disable timing)
+        """
+        self.path = path
+        self.enabled = path is not None
+        self.worker = False
+        self.stages = {}
+        self.frame_times = []
+        self.expected = 0
+        self.start = None
+        self.end = None
+        self.file = None
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+        Time a stage. Within a frame it is added to the frame, otherwise to the totals.
+        ------------------------------------------------------------
+        :param name: stage name
+        """
+        if not self.enabled:
+            yield
+            return
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            seconds = perf_counter() - start
+            record = getattr(self.local, "record", None)
+            if record is not None:
+                record["stages"][name] = record["stages"].get(name, 0) + seconds
+            else:
+                with self.lock:
+                    self.stages.setdefault(name, []).append(seconds)
+
+    @contextmanager
+    def frame(self, N: int = None):
+        """
+        Time a frame. Nested frames (and frames without a number) are not recorded separately.
+        ------------------------------------------------------------
+        :param N: frame number
+        """
+        if not self.enabled or N is None or getattr(self.local, "record", None) is not None:
+            yield
+            return
+        self.local.record = dict(N=int(N), stages={})
+        start = perf_counter()
+        with self.lock:
+            self.start = self.start or start
+        try:
+            yield
+        finally:
+            record, self.local.record = self.local.record, None
+            record["seconds"] = perf_counter() - start
+            if self.worker:  # the main process adds the frames of the workers
+                self.local.last = record
+            else:
+                self.add(record)
+
+    def last(self):
+        """
+        Record of the last frame of this thread (in a worker process).
+        ------------------------------------------------------------
+        :return: frame record or None
+        """
+        record, self.local.last = getattr(self.local, "last", None), None
+        return record
+
+    def add(self, record: dict = None):
+        """
+        Add a frame to the totals and write it to the JSON-lines file.
+        ------------------------------------------------------------
+        :param record: frame record with N, stages and seconds
+        """
+        if not self.enabled or record is None:
+            return self
+        with self.lock:
+            for name, seconds in record["stages"].items():
+                self.stages.setdefault(name, []).append(seconds)
+            self.frame_times.append(record["seconds"])
+            self.end = perf_counter()
+            if self.start is None:  # frames of worker processes
+                self.start = self.end - record["seconds"]
+            record = dict(record, stages={name: round(s, 5) for name, s in record["stages"].items()})
+            record.update(seconds=round(record["seconds"], 5), peak_rss_mb=peak_rss())
+            if self.file is None:
+                self.file = open(self.path, "a")
+            self.file.write(json.dumps(record) + "\n")
+            self.file.flush()
+        return self
+
+    def expect(self, frames: int):
+        """
+        Add frames that are going to be made, for the ETA.
+        ------------------------------------------------------------
+        :param frames: number of frames
+        """
+        self.expected += frames
+        return self
+
+    def progress(self):
+        """
+        Frames per second and ETA of the frames that are still expected.
+        ------------------------------------------------------------
+        :return: progress text (empty when timing is disabled)
+        """
+        if not self.enabled or not self.frame_times or self.end is None:
+            return ""
+        rate = len(self.frame_times) / max(self.end - self.start, 1e-9)
+        eta = max(self.expected - len(self.frame_times), 0) / rate
+        return f" | {rate:.2f} frames/s | ETA {int(eta // 60)}m{int(eta % 60):02d}s"
+
+    def summary(self):
+        """
+        Statistics of all stages and frames, which is also written to the JSON-lines file.
+        ------------------------------------------------------------
+        :return: summary as dictionary
+        """
+        summary = dict(
+            stages={
+                name: dict(
+                    count=len(times),
+                    total=round(float(np.sum(times)), 4),
+                    p50=round(float(np.percentile(times, 50)), 5),
+                    p95=round(float(np.percentile(times, 95)), 5),
+                )
+                for name, times in self.stages.items()
+            },
+            frames=len(self.frame_times),
+            peak_rss_mb=peak_rss(),
+        )
+        if self.frame_times:
+            summary.update(
+                frame_p50=round(float(np.percentile(self.frame_times, 50)), 5),
+                frame_p95=round(float(np.percentile(self.frame_times, 95)), 5),
+                frames_per_s=round(len(self.frame_times) / max(self.end - self.start, 1e-9), 3),
+            )
+        if self.enabled:
+            with self.lock:
+                if self.file is None:
+                    self.file = open(self.path, "a")
+                self.file.write(json.dumps(dict(summary=summary)) + "\n")
+                self.file.flush()
+        return summary
+
+    def report(self):
+        """
+        Human readable summary.
+        ------------------------------------------------------------
+        :return: summary text
+        """
+        summary = self.summary()
+        lines = [f"{'stage'.ljust(12)}{'count':>8}{'total (s)':>12}{'p50 (ms)':>12}{'p95 (ms)':>12}"]
+        for name, stage in sorted(summary["stages"].items(), key=lambda item: -item[1]["total"]):
+            lines.append(
+                f"{name.ljust(12)}{stage['count']:>8}{stage['total']:>12.2f}"
+                f"{stage['p50'] * 1e3:>12.1f}{stage['p95'] * 1e3:>12.1f}"
+            )
+        if summary["frames"]:
+            lines.append(
+                f"{summary['frames']} frames, {summary['frames_per_s']} frames/s, "
+                f"p50 {summary['frame_p50'] * 1e3:.1f} ms, p95 {summary['frame_p95'] * 1e3:.1f} ms per frame"
+            )
+        lines.append(f"Peak memory: {summary['peak_rss_mb']} MB")
+        return "\n".join(lines)
+
+    def as_worker(self):
+        """
+        Use this timer in a worker process: frames are returned to the main process instead of written.
+        """
+        self.worker = True
+        self.file = None
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        return self
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        return self
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for key in ["file", "lock", "local"]:
+            state[key] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.as_worker()
+
+
+if __name__ == "__main__":
+    print("Cannot call script directly.")
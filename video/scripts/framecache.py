@@ -0,0 +1,109 @@
+import hashlib
+import json
+import os
+import shutil
+
+__all__ = ["FrameCache"]
+
+CACHE_VERSION = 2  # change this when the rendering changes, so old frames are not reused
+
+
+class FrameCache:
+    """
+    FrameCache is a content-addressed cache of frames that persists across runs.
+    Frames are stored under a hash of everything that determines how they look, so identical frames
+    (for example the same zoom in and zoom out, or an unchanged part of an edited path) are only rendered once.
+    The least recently used frames are removed when the cache is larger than max_size.
+    """
+
+    def __init__(self, directory: str = ".frame_cache", max_size: float = 10):
+        """
+        :param directory: cache directory
+        :param max_size: maximum size of the cache in GB
+        """
+        self.directory = directory
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.directory, exist_ok=True)
+
+    @staticmethod
+    def key(**params):
+        """
+        Hash of the frame parameters.
+        Floats are rounded to 10 significant digits, so tiny differences from np.linspace do not matter.
+        ------------------------------------------------------------
+        :param params: everything that determines the frame
+        :return: hex digest
+        """
+        params = {k: f"{v:.10g}" if isinstance(v, float) else v for k, v in params.items()}
+        params["version"] = CACHE_VERSION
+        return hashlib.sha1(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()
+
+    def path(self, key):
+        return f"{self.directory}/{key[:2]}/{key}.png"
+
+    def fetch(self, key, frame_file):
+        """
+        Put a cached frame at frame_file (hard link, or copy when linking is not possible).
+        ------------------------------------------------------------
+        :param key: frame key
+        :param frame_file: where the frame should be
+        :return: True if the frame was in the cache
+        """
+        try:
+            os.utime(self.path(key))  # mark as recently used
+            if os.path.exists(frame_file):
+                os.remove(frame_file)
+            try:
+                os.link(self.path(key), frame_file)
+            except OSError:
+                shutil.copyfile(self.path(key), frame_file)
+        except FileNotFoundError:
+            self.misses += 1
+            return False
+        self.hits += 1
+        return True
+
+    def store(self, key, frame_file):
+        """
+        Add a rendered frame to the cache.
+        ------------------------------------------------------------
+        :param key: frame key
+        :param frame_file: rendered frame
+        """
+        os.makedirs(os.path.dirname(self.path(key)), exist_ok=True)
+        temp_file = f"{self.path(key)}.{os.getpid()}.tmp"
+        try:
+            os.link(frame_file, temp_file)
+        except OSError:
+            shutil.copyfile(frame_file, temp_file)
+        os.replace(temp_file, self.path(key))
+        return self
+
+    def prune(self):
+        """
+        Remove the least recently used frames until the cache is smaller than max_size.
+        """
+        frames = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                try:
+                    stat = os.stat(os.path.join(root, name))
+                except FileNotFoundError:
+                    continue
+                frames.append((stat.st_mtime, stat.st_size, os.path.join(root, name)))
+        total_size = sum(frame[1] for frame in frames)
+        for _, size, path in sorted(frames):
+            if total_size <= self.max_size * 1e9:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total_size -= size
+        return self
+
+
+if __name__ == "__main__":
+    print("Cannot call script directly.")
@@ -0,0 +1,104 @@
+import json
+import os
+
+import numpy as np
+
+__all__ = ["FrameManifest", "valid_png"]
+
+
+def valid_png(path):
+    """
+    Check if a png file is complete (it exists and ends with the IEND chunk).
+    ------------------------------------------------------------
+    :param path: path of the png
+    :return: True or False
+    """
+    try:
+        with open(path, "rb") as f:
+            f.seek(-12, os.SEEK_END)
+            return f.read(12)[4:8] == b"IEND"
+    except OSError:
+        return False
+
+
+class FrameManifest:
+    """
+    FrameManifest keeps track of the rendered frames in a JSON-lines file next to the frames.
+    Every line has the frame number, the frame parameters and the status of the frame.
+    When a render crashes, a restarted render with the same path only makes the missing or corrupt frames.
+    """
+
+    tolerance = 1e-9  # degrees, for ra, dec and imsize of a frame to be the same
+
+    def __init__(self, path: str = "frames/manifest.jsonl"):
+        """
+        :param path: manifest file
+        """
+        self.path = path
+        self.frames = {}
+        if os.path.isfile(self.path):
+            with open(self.path) as f:
+                for line in f:
+                    try:
+                        frame = json.loads(line)
+                    except ValueError:  # last line of a crashed run can be incomplete
+                        continue
+                    self.frames[frame["N"]] = frame
+        self.file = None
+
+    def record(self, N, ra, dec, imsize, dpi, status: str = "done"):
+        """
+        Add a frame to the manifest.
+        ------------------------------------------------------------
+        :param N: frame number
+        :param ra: right ascension (degrees)
+        :param dec: declination (degrees)
+        :param imsize: image size (degree size)
+        :param dpi: dots per inch
+        :param status: done or failed
+        """
+        frame = dict(N=int(N), ra=float(ra), dec=float(dec), imsize=float(imsize), dpi=int(dpi), status=status)
+        self.frames[frame["N"]] = frame
+        if self.file is None:
+            self.file = open(self.path, "a")
+        self.file.write(json.dumps(frame) + "\n")
+        self.file.flush()
+        return self
+
+    def is_done(self, N, ra, dec, imsize, dpi, frame_file: str = None):
+        """
+        Check if a frame with the same parameters is already made.
+        ------------------------------------------------------------
+        :param N: frame number
+        :param ra: right ascension (degrees)
+        :param dec: declination (degrees)
+        :param imsize: image size (degree size)
+        :param dpi: dots per inch
+        :param frame_file: frame file, which should be a complete png
+        :return: True or False
+        """
+        frame = self.frames.get(int(N))
+        if frame is None or frame["status"] != "done":
+            return False
+        if frame["dpi"] != int(dpi):
+            return False
+        if not np.allclose(
+            [frame["ra"], frame["dec"], frame["imsize"]], [ra, dec, imsize], rtol=0, atol=self.tolerance
+        ):
+            return False
+        return frame_file is None or valid_png(frame_file)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        return self
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["file"] = None
+        return state
+
+
+if __name__ == "__main__":
+    print("Cannot call script directly.")
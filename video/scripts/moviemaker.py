@@ -1,6 +1,13 @@
 import os
+import shutil
+import tempfile
 import warnings
-from glob import glob
+import weakref
+from collections import deque
+from contextlib import nullcontext
+from functools import partial
+from itertools import groupby
+from time import perf_counter
 from multiprocessing import Pool
 from multiprocessing.dummy import Pool as ThreadPool
 
@@ -8,12 +15,21 @@ import cv2 as cv
 import numpy as np
 from termcolor import colored
 
+from poster.scripts.estimate import format_bytes, format_seconds, predict, print_report
 from poster.scripts.imaging import ImagingLofar
+from video.scripts.framecache import FrameCache
+from video.scripts.manifest import FrameManifest
+from video.scripts.plan import FramePlan
+from video.scripts.sharedpool import init_worker, make_frame_worker, render_frame_worker
+from video.scripts.transitions import fit_frame, read_image, transition_frame
+from video.scripts.writers import FFmpegStream, FrameDirectory
 
 warnings.filterwarnings("ignore")
 
 __all__ = ["MovieMaker"]
 
+CANVAS_PIXELS = 2**25  # maximum pixels of a pan canvas (100 MB in RGB)
+
 
 class MovieMaker(ImagingLofar):
     """
@@ -34,6 +50,22 @@ class MovieMaker(ImagingLofar):
         zoom_effect: bool = False,
         output_file: str = "frames",
         cmap: str = None,
+        engine: str = "matplotlib",
+        frame_size: tuple = (1920, 1080),
+        workers: int = None,
+        stream: bool = False,
+        movie_file: str = "movie.mp4",
+        resume: bool = False,
+        cache: str = None,
+        cache_size: float = 10,
+        pyramid: bool = False,
+        memmap: bool = False,
+        timing: str = None,
+        plan: str = None,
+        shard: tuple = None,
+        keyframe_upscale: float = None,
+        pan_canvas: bool = False,
+        dry_run: bool = False,
     ):
         """
         :param fits_file: fits file name
@@ -42,7 +74,79 @@ class MovieMaker(ImagingLofar):
         :param process: process [multiprocess, multithread, None]
         :param fits_download: download fits file
         :param cmap: choose your favorite cmap
+        :param engine: render engine [matplotlib, numpy, agg]
+        :param frame_size: frame size in pixels (width, height), used by the numpy and agg engines
+        :param workers: number of threads or processes for preprocessing and for the multithread or multiprocess process
+                        (default: all cpu's)
+        :param stream: pipe the frames directly into ffmpeg instead of writing them to output_file
+        :param movie_file: output movie
+        :param resume: continue a crashed render of the same path in output_file, only missing frames are made
+        :param cache: directory of a frame cache that is reused across zooms and runs (not used when streaming)
+        :param cache_size: maximum size of the frame cache in GB
+        :param pyramid: render wide frames from a multi-resolution pyramid of the image
+        :param memmap: keep the image on disk (memory-mapped), for images larger than memory
+        :param timing: JSON-lines file for the time of every stage of every frame, with a summary after record()
+        :param plan: frame plan file. Without shard, the path is compiled into the plan instead of rendered and
+                     record() saves the plan. With shard, render_plan() renders the frames of the shard.
+        :param shard: shard (i, n) of the plan, shard i of n shards
+        :param keyframe_upscale: render zooms from keyframes, of which the frames in between are resampled.
+                                 This is the maximum upscaling of a resampled frame (for example 1.5).
+                                 Only for the numpy and agg engine, not with the zoom effect or a cutout fits file.
+                                 (None renders every frame)
+        :param pan_canvas: render the region of a pan once, and cut the frames of the pan from it.
+                           Only for the numpy and agg engine, not with a cutout fits file.
+        :param dry_run: only build the path, and estimate the frames, pixels, time and disk in record()
         """
+        if pan_canvas and engine not in ["numpy", "agg"]:
+            raise ValueError("Panning over a canvas needs the 'numpy' or 'agg' engine.")
+        if pan_canvas and fits_file is not None and "cutout" in fits_file:
+            raise ValueError(
+                "Panning over a canvas does not work with a cutout fits file, of which every frame is scaled to its "
+                "own maximum."
+            )
+        if keyframe_upscale is not None:
+            if keyframe_upscale <= 1:
+                raise ValueError("The maximum upscaling of keyframes should be larger than 1.")
+            if engine not in ["numpy", "agg"]:
+                raise ValueError("Zooming with keyframes needs the 'numpy' or 'agg' engine.")
+            if zoom_effect:
+                raise ValueError(
+                    "Zooming with keyframes does not work with the zoom effect, which changes the colours."
+                )
+            if fits_file is not None and "cutout" in fits_file:
+                raise ValueError(
+                    "Zooming with keyframes does not work with a cutout fits file, of which every frame is scaled to "
+                    "its own maximum."
+                )
+        self.plan = None
+        self.shard = shard
+        self.dry_run = dry_run
+        if plan is not None or dry_run:
+            if stream and plan is not None:
+                raise ValueError("A frame plan is rendered into a frame directory, it can not be streamed.")
+            if shard is not None:
+                self.plan = FramePlan.load(plan)
+            elif fits_file is None and not fits_download:
+                raise ValueError("A frame plan needs a fits file that the shards can open.")
+            else:
+                self.plan = FramePlan(
+                    plan,
+                    settings=dict(
+                        fits_file=None,  # set below, when the fits file is opened (or downloaded)
+                        imsize=imsize,
+                        framerate=framerate,
+                        text=text,
+                        vmin=vmin,
+                        vmax=vmax,
+                        zoom_effect=zoom_effect,
+                        output_file=os.path.abspath(output_file),
+                        cmap=cmap,
+                        engine=engine,
+                        frame_size=list(frame_size),
+                        movie_file=os.path.abspath(movie_file),
+                        pyramid=pyramid,
+                    ),
+                )
         self.output_file = output_file
         super().__init__(
             fits_file=fits_file,
@@ -52,7 +156,13 @@ class MovieMaker(ImagingLofar):
             vmin=vmin,
             vmax=vmax,
             zoom_effect=zoom_effect,
+            pyramid=pyramid,
+            memmap=memmap,
+            workers=workers,
+            timing=timing,
         )
+        if self.plan is not None and shard is None:
+            self.plan.settings["fits_file"] = os.path.abspath(self.fits_file)
         self.process = process
         self.imsize = imsize
         self.framerate = framerate
@@ -61,12 +171,35 @@ class MovieMaker(ImagingLofar):
         self.text = text
         self.zoom_effect = zoom_effect
         self.total_count = 0
+        self.engine = engine
+        self.frame_size = frame_size
+        self.failed_frames = []
         if cmap:
             self.cmap = cmap
         else:
             self.cmap = "CMRmap"
-        if new:
-            os.system(f"rm -rf {output_file}; mkdir {output_file}")
+        self.stream = stream
+        self.movie_file = movie_file
+        self.resume = resume
+        self.manifest = None
+        if self.stream:
+            if self.engine == "matplotlib":
+                raise ValueError("Streaming frames into ffmpeg needs the 'numpy' or 'agg' engine.")
+            self.writer = FFmpegStream(movie_file=movie_file, framerate=framerate, frame_size=frame_size)
+        else:
+            if new and not resume and plan is None and not dry_run:
+                os.system(f"rm -rf {output_file}; mkdir {output_file}")
+            self.writer = FrameDirectory(output_file)
+            if self.shard is not None:  # shards write their own manifest, also on a shared filesystem
+                self.manifest = FrameManifest(f"{output_file}/manifest_{self.shard[0]}of{self.shard[1]}.jsonl")
+            else:
+                self.manifest = FrameManifest(f"{output_file}/manifest.jsonl")
+        self.keyframe_upscale = keyframe_upscale
+        self.pan_canvas = pan_canvas
+        self.cache = None
+        if cache and not self.stream:
+            self.cache = FrameCache(directory=cache, max_size=cache_size)
+        self.pool = None  # process pool of the multiprocess process, made on first use
 
     def __call__(self, imsize: float = None, process: str = None):
         """
@@ -91,13 +224,21 @@ class MovieMaker(ImagingLofar):
         if self.process == "multiprocess":
             state = self.__dict__.copy()
             del state["hdu"]
+            if self.shared_image is not None:  # workers read the image from shared memory
+                del state["image_data"]
+                del state["frame_data"]
+                state["pyramid"] = None
+            if self.stream:  # only the main process writes to ffmpeg
+                state["writer"] = None
+            state["pool"] = None
+            state["manifest"] = None  # only the main process writes the manifest
             return state
 
     def __setstate__(self, state):
         """This is called while unpickling."""
         self.__dict__.update(state)
 
-    def make_frame(self, N, ra=None, dec=None, imsize: float = None, dpi: float = 300):
+    def make_frame(self, N, ra=None, dec=None, imsize: float = None, dpi: float = 300, pix: tuple = None):
         """
         Make separate frame (image)
         ------------------------------------------------------------
@@ -106,6 +247,7 @@ class MovieMaker(ImagingLofar):
         :param dec: declination (degrees)
         :param imsize: image size (pixel or degree size)
         :param dpi: dots per inch (pixel density)
+        :param pix: pixel position of (ra, dec), when it is already known
         """
 
         # Uncomment for e.g. debugging or testing a new path
@@ -113,41 +255,182 @@ class MovieMaker(ImagingLofar):
         #     import sys
         #     sys.exit('Frame limit reached, exiting program')
 
-        print(colored(f"Frame number: {N - self.N_min}/{self.N_max - self.N_min}", "red"), end="\r")
+        self.progress(N)
+
+        with self.timer.frame(N):
+            if self.cache is not None:
+                with self.timer.stage("cache"):
+                    key = self.frame_key(ra=ra, dec=dec, imsize=imsize, dpi=dpi)
+                    if self.cache.fetch(key, self.writer.frame_name(N)):
+                        return self
+
+            if self.engine in ["numpy", "agg"]:
+                image = self.render_frame(ra=ra, dec=dec, imsize=imsize, pix=pix)
+                with self.timer.stage("save"):
+                    self.writer.write(N, image)
+            else:
+                self.image_cutout(
+                    pos=(ra, dec),
+                    pix=pix,
+                    size=self.cutout_size(imsize),
+                    dpi=dpi,
+                    image_name=os.path.basename(self.writer.temp_name(N)),
+                    cmap=self.cmap,
+                    text=self.text,
+                    imsize=imsize,
+                )
+                with self.timer.stage("save"):
+                    os.replace(self.writer.temp_name(N), self.writer.frame_name(N))
+
+            if self.cache is not None:
+                with self.timer.stage("cache"):
+                    self.cache.store(key, self.writer.frame_name(N))
+        return self
+
+    def progress(self, N):
+        """
+        Print the frame number (with frames per second and ETA when timing is on).
+        ------------------------------------------------------------
+        :param N: frame number
+        """
+        if self.timer.worker:  # the main process prints the progress of the workers
+            return
+        print(
+            colored(f"Frame number: {N - self.N_min}/{self.N_max - self.N_min}{self.timer.progress()}", "red"),
+            end="\r",
+        )
+
+    def frame_key(self, ra=None, dec=None, imsize: float = None, dpi: float = 300):
+        """
+        Key of a frame in the frame cache, from everything that determines how the frame looks.
+        ------------------------------------------------------------
+        :param ra: right ascension (degrees)
+        :param dec: declination (degrees)
+        :param imsize: image size (degree size)
+        :param dpi: dots per inch (only used by the matplotlib engine)
+        :return: frame key
+        """
+        fits_stat = os.stat(self.fits_file)
+        return FrameCache.key(
+            fits_file=os.path.abspath(self.fits_file),
+            fits_size=fits_stat.st_size,
+            fits_mtime=fits_stat.st_mtime_ns,
+            ra=float(ra),
+            dec=float(dec),
+            imsize=float(imsize),
+            dpi=int(dpi) if self.engine == "matplotlib" else None,
+            cmap=self.cmap,
+            vmin=float(self.vmin),
+            vmax=float(self.vmax),
+            zoom_effect=self.zoom_effect,
+            engine=self.engine,
+            frame_size=list(self.frame_size),
+            text=self.text,
+            pyramid=self.pyramid is not None,
+        )
 
+    def cutout_size(self, imsize: float = None):
+        """
+        Cutout size in pixels of a frame
+        ------------------------------------------------------------
+        :param imsize: image size (degree size)
+        :return: cutout size (y, x)
+        """
         # reduce jitter by always having a central pixel (force odd size)
-        size1 = np.int(imsize / np.max(self.wcs.pixel_scale_matrix))
-        size2 = np.int(imsize / np.max(self.wcs.pixel_scale_matrix) * 1.77)
+        size1 = np.int(imsize / self.pixel_scale)
+        size2 = np.int(imsize / self.pixel_scale * 1.77)
         if size1 % 2 == 0:
             size1 = size1 + 1
         if size2 % 2 == 0:
             size2 = size2 + 1
-        self.image_cutout(
-            pos=(ra, dec),
-            size=(size1, size2),
-            dpi=dpi,
-            image_name=f'image_{str(N).rjust(5, "0")}.png',
-            cmap=self.cmap,
-            text=self.text,
-            imsize=imsize,
-        )
-        return self
+        return size1, size2
+
+    def render_frame(
+        self,
+        ra=None,
+        dec=None,
+        imsize: float = None,
+        pix: tuple = None,
+        N: int = None,
+        frame_size: tuple = None,
+        label: bool = True,
+    ):
+        """
+        Render a frame to an RGB buffer, without pyplot (numpy and agg engine).
+        This is thread-safe, so it can be used with the multithread process.
+        ------------------------------------------------------------
+        :param ra: right ascension (degrees)
+        :param dec: declination (degrees)
+        :param imsize: image size (degree size)
+        :param pix: pixel position of (ra, dec), when it is already known
+        :param N: frame number (to time this frame, when it is rendered on its own)
+        :param frame_size: frame size in pixels (width, height), for example of a keyframe (default: self.frame_size)
+        :param label: draw the text or coordinates in the frame
+        :return: RGB image as uint8 array with shape (height, width, 3)
+        """
+        if frame_size is None:
+            frame_size = self.frame_size
+        with self.timer.frame(N):
+            with self.timer.stage("wcs"):
+                pix_x, pix_y = pix if pix is not None else self.to_pixel(ra, dec)
+            size = self.cutout_size(imsize)
+            level = self.pyramid_level(size[0], frame_size[1])
+            with self.timer.stage("cutout"):
+                image_data, _ = self.make_cutout((int(pix_x), int(pix_y)), size, level=level, with_wcs=False)
+            if self.engine == "agg":
+                return self.render_agg(
+                    image_data=image_data,
+                    imsize=imsize,
+                    cmap=self.cmap,
+                    frame_size=frame_size,
+                    text=self.text if label else None,
+                    ra=ra if label else None,
+                    dec=dec if label else None,
+                    dpi=frame_size[1] / 10.8,
+                )
+            image = self.render_rgb(image_data=image_data, imsize=imsize, cmap=self.cmap, frame_size=frame_size)
+            if label:
+                with self.timer.stage("draw"):
+                    self.label(image, ra, dec, imsize)
+            return image
+
+    def label(self, image, ra=None, dec=None, imsize: float = None):
+        """
+        Draw the text, or the coordinates of wide frames, in an RGB frame (in place).
+        ------------------------------------------------------------
+        :param image: RGB image
+        :param ra: right ascension (degrees)
+        :param dec: declination (degrees)
+        :param imsize: image size (degree size)
+        :return: RGB image
+        """
+        scale = image.shape[0] / 1080
+        if self.text:
+            annotate(image, self.text, fontscale=1.4 * scale)
+        elif ra and dec and imsize > 0.1:
+            annotate(image, f"RA: {round(ra, 5)}\nDEC: {round(dec, 5)}", fontscale=0.8 * scale)
+        return image
 
-    def make_frames(self):
+    def make_frames(self, path: str = None):
         """
         Record individual frames and save in frames/
         ------------------------------------------------------------
+        :param path: kind of path of the frames ['zoom', 'pan'], zooms can be made from keyframes (keyframe_upscale)
+                     and pans from a canvas (pan_canvas)
         """
 
         total_frames = 0  # Total number of frames currently made
-        with os.scandir(self.output_file) as it:
-            for entry in it:
-                if entry.is_file():
-                    total_frames += 1
+        if self.stream or self.resume or self.plan is not None:  # frame numbers follow the path
+            total_frames = self.total_count
+        else:
+            with os.scandir(self.output_file) as it:
+                for entry in it:
+                    if entry.is_file() and entry.name.startswith("image_"):
+                        total_frames += 1
 
         self.N_max = total_frames + len(self.ragrid)  # max number of videos
         self.N_min = total_frames  # min number of videos
-        inputs = zip(
+        frames = zip(
             range(self.N_min, self.N_max),
             self.ragrid,
             self.decgrid,
@@ -156,34 +439,292 @@ class MovieMaker(ImagingLofar):
         )
 
         print("-------------------------------------------------")
-        print(colored(f"Imaging {len(self.ragrid)} frames for current move.", "green"))
+        if self.plan is not None:
+            self.plan.add(frames)
+            print(colored(f"Planned {self.N_max - self.N_min} frames for current move.", "green"))
+        else:
+            self.render_frames(self.frame_inputs(frames), path=path)
+        self.total_count = self.N_max
+        print("-------------------------------------------------")
+        return self
 
-        if self.process == "multithread":
-            print(f"Multithreading")
-            print(f"Might get error or bad result because multithreading is difficult with imaging.")
-            with ThreadPool(8) as p:
-                p.starmap(self.make_frame, inputs)
-        elif self.process == "multiprocess":
-            cpus = 2
-            print(f"You are using {cpus} cpu's for multiprocessing")
+    def frame_inputs(self, frames):
+        """
+        Add the pixel positions to the frame parameters, for the whole path at once.
+        ------------------------------------------------------------
+        :param frames: frame parameters (N, ra, dec, imsize, dpi)
+        :return: frame inputs (N, ra, dec, imsize, dpi, pix)
+        """
+        frames = list(frames)
+        if not frames:
+            return []
+        with self.timer.stage("wcs"):
+            pix_x, pix_y = self.wcs.world_to_pixel_values(
+                np.array([frame[1] for frame in frames], float), np.array([frame[2] for frame in frames], float)
+            )
+        return [(*frame, pix) for frame, pix in zip(frames, zip(pix_x, pix_y))]
+
+    def render_frames(self, inputs, path: str = None):
+        """
+        Render frames with the chosen process and add them to the manifest.
+        ------------------------------------------------------------
+        :param inputs: frame inputs (N, ra, dec, imsize, dpi, pix)
+        :param path: kind of path of the frames ['zoom', 'pan']
+        """
+        if (self.resume or self.shard is not None) and self.manifest is not None:
+            todo = [inp for inp in inputs if not self.manifest.is_done(*inp[:5], self.writer.frame_name(inp[0]))]
+            print(colored(f"Resuming: {len(inputs) - len(todo)} frames are already made.", "green"))
+            inputs = todo
+        print(colored(f"Imaging {len(inputs)} frames for current move.", "green"))
+        self.timer.expect(len(inputs))
 
-            def chunked_input(input, chunksize):
-                input = list(input)
-                input_out = []
-                for r in range(chunksize):
-                    input_out += input[r::chunksize]
-                del input
-                return input_out
+        if path == "zoom" and self.keyframe_upscale:
+            self.zoom_frames(inputs)
+        elif path == "pan" and self.pan_canvas:
+            self.pan_frames(inputs)
+        elif self.stream:
+            self.stream_frames(inputs)
+        elif self.process == "multithread":
+            print(f"Multithreading with {self.workers} threads")
+            if self.engine == "matplotlib":
+                print(f"Might get error or bad result because multithreading is difficult with pyplot.")
+                print(f"Use the 'numpy' or 'agg' engine for thread-safe rendering.")
 
-            try:
-                with Pool(cpus) as p:
-                    p.starmap(self.make_frame, chunked_input(inputs, cpus), chunksize=cpus)
-            except BaseException:
-                pass
+            def make_frame(inp):
+                self.make_frame(*inp)
+                return inp
+
+            with ThreadPool(self.workers) as p:
+                for inp in p.imap_unordered(make_frame, inputs):
+                    self.manifest.record(*inp[:5])
+        elif self.process == "multiprocess":
+            print(f"You are using {self.workers} cpu's for multiprocessing")
+            failed = []
+            frames = {inp[0]: inp for inp in inputs}
+            chunksize = max(len(inputs) // (self.workers * 4), 1)
+            for N, error, timing in self.process_pool().imap_unordered(make_frame_worker, inputs, chunksize=chunksize):
+                self.timer.add(timing)
+                self.progress(N)
+                if error:
+                    failed.append(N)
+                    print(colored(f"Frame {N} failed:\n{error}", "red"))
+                self.manifest.record(*frames[N][:5], status="failed" if error else "done")
+            if failed:
+                print(colored(f"{len(failed)} frames failed: {sorted(failed)}", "red"))
+                self.failed_frames += sorted(failed)
         else:
             for inp in inputs:
-                self.make_frame(inp[0], inp[1], inp[2], inp[3], inp[4])
+                self.make_frame(*inp)
+                self.manifest.record(*inp[:5])
+        if self.cache is not None:
+            self.cache.prune()
+        return self
+
+    def render_plan(self):
+        """
+        Render the frames of the shard of the frame plan. Frames that the shard already made are skipped,
+        so a shard that crashed can simply be started again. When all shards are done, merge the plan.
+        """
+        i, n = self.shard
+        self.N_min, self.N_max = 0, len(self.plan.frames)
+        print("-------------------------------------------------")
+        print(colored(f"Shard {i}/{n} of plan {self.plan.path}", "green"))
+        self.render_frames(self.frame_inputs(self.plan.shard(i, n)))
+        self.close_pool()
+        self.manifest.close()
         print("-------------------------------------------------")
+        if self.failed_frames:
+            print(colored(f"Shard {i}/{n} has {len(self.failed_frames)} failed frames, run it again.", "red"))
+        if self.timer.enabled:
+            print(colored("Timing summary:", "green"))
+            print(self.timer.report())
+            self.timer.close()
+        return self
+
+    def stream_frames(self, inputs):
+        """
+        Render frames (in parallel with the multithread or multiprocess process) and write them in order to ffmpeg.
+        At most a few frames per worker are kept in memory, so rendering waits when ffmpeg can not keep up.
+        ------------------------------------------------------------
+        :param inputs: frame inputs (N, ra, dec, imsize, dpi, pix)
+        """
+        if self.process == "multithread":
+            pool, render = ThreadPool(self.workers), self.render_frame
+        elif self.process == "multiprocess":
+            pool, render = nullcontext(self.process_pool()), render_frame_worker  # the pool is used again
+        else:
+            for N, ra, dec, imsize, _, pix in inputs:
+                self.progress(N)
+                image = self.render_frame(ra=ra, dec=dec, imsize=imsize, pix=pix, N=N)
+                with self.timer.stage("encode"):
+                    self.writer.write(N, image)
+            return self
+
+        def write_next():
+            n, frame = pending.popleft()
+            image = frame.get()
+            if self.process == "multiprocess":
+                image, error, timing = image
+                if error:  # a missing frame would break the movie
+                    raise RuntimeError(f"Frame {n} failed:\n{error}")
+                self.timer.add(timing)
+            self.progress(n)
+            with self.timer.stage("encode"):
+                self.writer.write(n, image)
+
+        with pool as p:
+            pending = deque()
+            for N, ra, dec, imsize, _, pix in inputs:
+                pending.append((N, p.apply_async(render, (ra, dec, imsize, pix, N))))
+                if len(pending) >= 2 * self.workers:
+                    write_next()
+            while pending:
+                write_next()
+        return self
+
+    def zoom_frames(self, inputs):
+        """
+        Make the frames of a zoom from keyframes. A keyframe is rendered at keyframe_upscale times the frame size,
+        and the smaller frames after it are cropped from it and scaled to the frame size, until a frame would be
+        upscaled by more than keyframe_upscale. So there is a keyframe every keyframe_upscale**2 in image size.
+        With the multithread or multiprocess process, the frames are resampled and saved in threads.
+        Frames of keyframes are not stored in the frame cache.
+        ------------------------------------------------------------
+        :param inputs: frame inputs (N, ra, dec, imsize, dpi, pix) of a zoom
+        """
+        if not inputs:
+            return self
+        key_size = tuple(int(round(self.keyframe_upscale * size)) for size in self.frame_size)
+        keys = keyframe_groups([inp[3] for inp in inputs], self.keyframe_upscale**2)
+        print(colored(f"Zooming with {len(set(keys))} keyframes.", "green"))
+
+        with ThreadPool(self.workers if self.process else 1) as p:
+            for key, group in groupby(zip(keys, inputs), key=lambda item: item[0]):
+                _, ra, dec, imsize, _, pix = inputs[key]
+                keyframe = self.render_frame(ra=ra, dec=dec, imsize=imsize, pix=pix, frame_size=key_size, label=False)
+                key_cutout = self.cutout_size(imsize)
+                self.resampled_frames(
+                    p,
+                    [inp for _, inp in group],
+                    lambda inp: resample_keyframe(keyframe, key_cutout, self.cutout_size(inp[3]), self.frame_size),
+                )
+        return self
+
+    def pan_frames(self, inputs):
+        """
+        Make the frames of a pan (constant image size) from a canvas. The region of the pan is rendered once at the
+        pixel scale of the frames, and every frame is a window of the canvas at the sub-pixel position of the frame.
+        The positions come from the wcs, so a pan over RA 0/360 is continuous. Long pans are split over canvases of
+        at most CANVAS_PIXELS pixels.
+        With the multithread or multiprocess process, the frames are cut and saved in threads.
+        Frames of a canvas are not stored in the frame cache.
+        ------------------------------------------------------------
+        :param inputs: frame inputs (N, ra, dec, imsize, dpi, pix) of a pan
+        """
+        if not inputs:
+            return self
+        imsize = inputs[0][3]
+        size = self.cutout_size(imsize)
+        level = self.pyramid_level(size[0], self.frame_size[1])
+        factor = 2**level
+        # everything in pixels of the pyramid level, (x, y)
+        pix = (np.array([inp[5] for inp in inputs], dtype=float) + 0.5) / factor - 0.5
+        half = np.array([size[1], size[0]]) / factor / 2
+        scale = np.array(self.frame_size) / (2 * half)  # frame pixels per image pixel
+        chunks = canvas_chunks(pix, half + 1, scale, CANVAS_PIXELS)
+        print(colored(f"Panning over {len(chunks)} canvases.", "green"))
+
+        with ThreadPool(self.workers if self.process else 1) as p:
+            for start, stop in chunks:
+                # odd canvas cutout around a central pixel, with a margin of a pixel
+                low = np.floor(pix[start:stop].min(axis=0) - half) - 1
+                high = np.ceil(pix[start:stop].max(axis=0) + half) + 1
+                center = np.ceil((low + high) / 2).astype(int)
+                canvas_size = 2 * np.maximum(center - low, high - center).astype(int) + 1  # (x, y)
+                corner = center - (canvas_size - 1) // 2
+                with self.timer.stage("cutout"):
+                    image_data, _ = self.make_cutout(
+                        tuple(factor * (center + 0.5) - 0.5),
+                        (canvas_size[1] * factor, canvas_size[0] * factor),
+                        level=level,
+                        with_wcs=False,
+                    )
+                canvas_frame = tuple(int(n) for n in np.round(canvas_size * scale))
+                if self.engine == "agg":
+                    canvas = self.render_agg(
+                        image_data=image_data,
+                        imsize=imsize,
+                        cmap=self.cmap,
+                        frame_size=canvas_frame,
+                        dpi=self.frame_size[1] / 10.8,
+                    )
+                else:
+                    canvas = self.render_rgb(
+                        image_data=image_data, imsize=imsize, cmap=self.cmap, frame_size=canvas_frame
+                    )
+                canvas_scale = np.array(canvas_frame) / canvas_size
+                self.resampled_frames(
+                    p,
+                    inputs[start:stop],
+                    lambda inp: canvas_window(
+                        canvas, canvas_scale, corner, (np.array(inp[5]) + 0.5) / factor - 0.5, half, self.frame_size
+                    ),
+                )
+        return self
+
+    def resampled_frames(self, pool, inputs, resample):
+        """
+        Resample, label and save frames in a thread pool. Streamed frames are written in order.
+        ------------------------------------------------------------
+        :param pool: thread pool
+        :param inputs: frame inputs (N, ra, dec, imsize, dpi, pix)
+        :param resample: function that makes the RGB image of a frame from its inputs
+        """
+
+        def make_frame(inp):
+            N, ra, dec, imsize, dpi, _ = inp
+            self.progress(N)
+            with self.timer.frame(N):
+                with self.timer.stage("resample"):
+                    image = resample(inp)
+                with self.timer.stage("draw"):
+                    self.label(image, ra, dec, imsize)
+                if not self.stream:
+                    with self.timer.stage("save"):
+                        self.writer.write(N, image)
+            return inp, image
+
+        for inp, image in pool.imap(make_frame, inputs):
+            if self.stream:
+                with self.timer.stage("encode"):
+                    self.writer.write(inp[0], image)
+            else:
+                self.manifest.record(*inp[:5])
+        return self
+
+    def process_pool(self):
+        """
+        Process pool of which the workers read the (preprocessed) image from shared memory.
+        The image is copied only once to shared memory; the tasks only contain the frame parameters.
+        A memory-mapped image is not copied, the workers map the same file.
+        The pool is made on first use and used for all moves and zooms, until close_pool().
+        ------------------------------------------------------------
+        :return: multiprocessing Pool
+        """
+        if self.pool is None:
+            self.share_image()
+            self.pool = Pool(self.workers, initializer=init_worker, initargs=(self,))
+            weakref.finalize(self, self.pool.terminate)
+        return self.pool
+
+    def close_pool(self):
+        """
+        Close the process pool, after the workers finished their frames.
+        """
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
         return self
 
     def move_to(self, first_time: bool = False, ra: float = None, dec: float = None, N_frames: int = None):
@@ -217,7 +758,7 @@ class MovieMaker(ImagingLofar):
         else:
             self.decgrid = np.linspace(dec, start_dec, N_frames)[::-1]
         self.imsizes = [self.imsize] * N_frames
-        self.make_frames()
+        self.make_frames(path="pan")
         return self
 
     def zoom(self, N_frames: int = None, first_time: bool = False, imsize_out: float = None, full_im: bool = False):
@@ -230,7 +771,7 @@ class MovieMaker(ImagingLofar):
         :param full_im: start with full image (when first_time==True)
         """
         if first_time:
-            begin_size = self.image_data.shape[0] * np.max(self.wcs.pixel_scale_matrix)
+            begin_size = self.image_data.shape[0] * self.pixel_scale
             if not full_im:
                 begin_size /= 2
             end_size = self.imsize
@@ -244,7 +785,7 @@ class MovieMaker(ImagingLofar):
         self.imsize = self.imsizes[-1]
         self.ragrid = np.array([self.ra] * len(self.imsizes))
         self.decgrid = np.array([self.dec] * len(self.imsizes))
-        self.make_frames()
+        self.make_frames(path="zoom")
         return self
 
     # def zoom_out(self, N_frames: int = None, imsize_out: float = None):
@@ -261,59 +802,327 @@ class MovieMaker(ImagingLofar):
     #     self.make_frames()
     #     return self
 
+    def transition(
+        self,
+        source=None,
+        N_frames: int = None,
+        effect: str = "zoom",
+        hold: int = 0,
+        back: bool = True,
+        start=None,
+    ):
+        """
+        Transition from the last frame to an image, for example a high resolution image of a source.
+        The frames are blended in threads and written as the next frames of the movie (frames or stream).
+        The image is held by repeating its frame, without blending or encoding it again.
+        ------------------------------------------------------------
+        :param source: image file or RGB image to go to (fitted in the frame)
+        :param N_frames: number of frames of the transition
+        :param effect: transition effect [crossfade, zoom]
+        :param hold: number of extra frames to show the image
+        :param back: transition back to the last frame after the hold
+        :param start: image file or RGB image to start from (default: the last frame, blurred)
+        """
+        if N_frames is None or N_frames < 1:
+            raise ValueError("A transition needs at least one frame.")
+        if self.plan is not None:
+            raise ValueError("A transition can not be planned, it needs the frames before it.")
+        frame_size = self.frame_size
+        if self.total_count > 0:  # same size as the frames before (also of the matplotlib engine)
+            last = self.last_frame()
+            frame_size = (last.shape[1], last.shape[0])
+            if start is None:
+                start = cv.GaussianBlur(last, (5, 5), 0)
+        elif start is None:
+            raise ValueError("There is no last frame to start the transition from, give a start image.")
+        start = fit_frame(read_image(start), frame_size)
+        end = fit_frame(read_image(source), frame_size)
+        alphas = np.linspace(0, 1, N_frames)
+        self.N_min = self.total_count
+        self.N_max = self.N_min + (2 * N_frames - 1 if back else N_frames) + hold
+
+        def make_frame(step):
+            N, alpha = step
+            self.progress(N)
+            with self.timer.frame(N):
+                with self.timer.stage("blend"):
+                    image = transition_frame(start, end, alpha, effect)
+                if not self.stream:
+                    with self.timer.stage("save"):
+                        self.writer.write(N, image)
+            return N, image
+
+        def write_frames(steps):
+            for N, image in p.imap(make_frame, steps):
+                if self.stream:
+                    with self.timer.stage("encode"):
+                        self.writer.write(N, image)
+
+        print("-------------------------------------------------")
+        print(colored(f"Transition of {self.N_max - self.N_min} frames.", "green"))
+        with ThreadPool(self.workers) as p:
+            write_frames(zip(range(self.N_min, self.N_min + N_frames), alphas))
+            if hold:
+                self.writer.hold(self.N_min + N_frames - 1, hold)
+            if back:
+                write_frames(zip(range(self.N_min + N_frames + hold, self.N_max), alphas[::-1][1:]))
+        self.total_count = self.N_max
+        print("-------------------------------------------------")
+        return self
+
+    def estimate(self, samples: int = 5):
+        """
+        Estimate the frames, pixels, time and disk of the planned frames (dry run).
+        A few frames, from the smallest to the largest cutout, are made in a temporary directory to calibrate the
+        time per frame, which is extrapolated with the number of cutout pixels. The estimate is for frames that are
+        made one by one (not from keyframes or a pan canvas), in parallel by all workers of the process.
+        ------------------------------------------------------------
+        :param samples: number of frames to calibrate with
+        :return: estimate as dictionary
+        """
+        frames = self.plan.frames
+        if not frames:
+            print(colored("There are no frames in the plan.", "red"))
+            return {}
+        imsizes, dpis = np.array([frame[3] for frame in frames]), np.array([frame[4] for frame in frames])
+        cutouts = [self.cutout_size(imsize) for imsize in imsizes]
+        if self.engine == "matplotlib":  # see image_cutout, the figure is 9 inch wide
+            levels = [self.pyramid_level(size[1], 9 * min(dpi, size[0])) for size, dpi in zip(cutouts, dpis)]
+        else:
+            levels = [self.pyramid_level(size[0], self.frame_size[1]) for size in cutouts]
+        pixels = np.prod(cutouts, axis=1).astype(float)
+        read = pixels / 4.0 ** np.array(levels)  # pixels that are read from the pyramid level
+
+        # calibrate with frames spread over the cutout sizes
+        order = np.argsort(read, kind="stable")
+        picks = list(np.unique(order[np.linspace(0, len(order) - 1, min(samples, len(order))).astype(int)]))
+        directory = tempfile.mkdtemp(prefix="dryrun_")
+        writer, image_directory, cache = self.writer, self.image_directory, self.cache
+        self.writer, self.image_directory, self.cache = FrameDirectory(directory), directory, None
+        self.N_min, self.N_max = 0, len(frames)
+        seconds, sizes, shapes = [], [], []
+        try:
+            for n, index in enumerate([picks[0]] + picks):  # the first frame warms up
+                inp = self.frame_inputs([frames[index]])[0]
+                start = perf_counter()
+                self.make_frame(*inp)
+                if n > 0:
+                    seconds.append(perf_counter() - start)
+                    sizes.append(os.path.getsize(self.writer.frame_name(inp[0])))
+                    shapes.append(cv.imread(self.writer.frame_name(inp[0])).shape[:2])
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+            self.writer, self.image_directory, self.cache = writer, image_directory, cache
+        print()
+
+        workers = self.workers if self.process in ["multithread", "multiprocess"] else 1
+        total_seconds = float(np.sum(predict(read[picks], seconds, read))) / workers
+        total_bytes = 0 if self.stream else float(np.sum(predict(read[picks], sizes, read)))
+        estimate = dict(
+            frames=len(frames),
+            movie_seconds=len(frames) / self.framerate,
+            dpi=(int(dpis.min()), int(dpis.max())),
+            cutout_pixels=(float(pixels.mean()), float(pixels.max())),
+            read_pixels=(float(read.mean()), float(read.max())),
+            frame_shape=tuple(int(n) for n in np.max(shapes, axis=0)),
+            calibration_seconds=(float(min(seconds)), float(max(seconds))),
+            seconds=total_seconds,
+            frame_bytes=total_bytes,
+        )
+        print_report(
+            "Dry run of the movie (no frames are made)",
+            [
+                ("Frames", f"{len(frames)} ({format_seconds(estimate['movie_seconds'])} of movie)"),
+                (
+                    "Cutout pixels per frame",
+                    f"mean {pixels.mean() / 1e6:.2f} Mpix, max {pixels.max() / 1e6:.2f} Mpix"
+                    + (f" (read: mean {read.mean() / 1e6:.2f}, max {read.max() / 1e6:.2f})" if self.pyramid else ""),
+                ),
+                (
+                    "dpi",
+                    f"{estimate['dpi'][0]} - {estimate['dpi'][1]}"
+                    + ("" if self.engine == "matplotlib" else " (not used)"),
+                ),
+                ("Frame size", f"{estimate['frame_shape'][1]} x {estimate['frame_shape'][0]} pixels"),
+                ("Calibration", f"{len(seconds)} frames, {min(seconds):.3f} - {max(seconds):.3f} s per frame"),
+                ("Predicted time", f"{format_seconds(total_seconds)} ({workers} workers, {self.engine} engine)"),
+                (
+                    "Disk",
+                    (
+                        "frames are streamed into ffmpeg"
+                        if self.stream
+                        else f"{format_bytes(total_bytes)} of frames in {self.output_file}"
+                    ),
+                ),
+            ],
+        )
+        return estimate
+
+    def last_frame(self):
+        """
+        Last frame of the movie.
+        ------------------------------------------------------------
+        :return: RGB image as uint8 array
+        """
+        if self.stream:
+            width, height = self.frame_size
+            return np.frombuffer(self.writer.last, dtype=np.uint8).reshape(height, width, 3)
+        return read_image(self.writer.frame_name(self.total_count - 1))
+
     def record(self, audio: str = None):
         """
         Frames to video, which will be saved as movie.mp4.
         ------------------------------------------------------------
         :param audio: add audio (True or False).
         """
-        os.system(
-            f"rm movie.mp4; ffmpeg -f image2 -r {self.framerate} -start_number 0 -i {self.output_file}/image_%05d.png movie.mp4"
-        )
+        self.close_pool()
+        if self.plan is not None:  # the shards make the frames and the merge records the movie
+            if self.plan.path is not None:
+                self.plan.save()
+                print(colored(f"Saved a plan of {len(self.plan.frames)} frames in {self.plan.path}", "green"))
+            if self.dry_run:
+                self.estimate()
+            return self
+        with self.timer.stage("encode"):
+            if self.stream:
+                self.writer.close()
+            else:
+                self.manifest.close()
+                self.writer.record(self.movie_file, self.framerate)
+        if self.timer.enabled:
+            print(colored("Timing summary:", "green"))
+            print(self.timer.report())
+            self.timer.close()
 
         if audio:
             try:
                 audio_file = input(audio)
-                os.system(f"ffmpeg -i movie.mp4 -i {audio_file} -t 65 audiomovie.mp4")
+                os.system(f"ffmpeg -i {self.movie_file} -i {audio_file} -t 65 audiomovie.mp4")
             except BaseException:
                 print("Audio file does not exist")
         return self
 
 
-def crop_center(img, cropx, cropy):
-    y, x, _ = img.shape
-    startx = x // 2 - (cropx // 2)
-    starty = y // 2 - (cropy // 2)
-    return img[starty : starty + cropy, startx : startx + cropx, :]
+def annotate(img, text, fontscale: float = 0.5):
+    """
+    Write text in a white box in the lower left corner of an RGB frame (in place).
+    ------------------------------------------------------------
+    :param img: RGB image
+    :param text: text (can have multiple lines)
+    :param fontscale: opencv font scale
+    """
+    lines = text.split("\n")
+    thickness = max(int(fontscale * 2), 1)
+    (width, height), baseline = cv.getTextSize(max(lines, key=len), cv.FONT_HERSHEY_SIMPLEX, fontscale, thickness)
+    line_height = height + baseline + 4
+    top = img.shape[0] - line_height * len(lines) - 8
+    cv.rectangle(img, (0, top), (width + 16, img.shape[0]), (255, 255, 255), -1)
+    for n, line in enumerate(lines):
+        y = top + 4 + line_height * n + height
+        cv.putText(img, line, (8, y), cv.FONT_HERSHEY_SIMPLEX, fontscale, (0, 0, 0), thickness, cv.LINE_AA)
+    return img
+
+
+def keyframe_groups(imsizes, max_ratio: float = 2.25):
+    """
+    Keyframe of every frame of a zoom. The largest frame is a keyframe, and every frame belongs to the smallest
+    keyframe that is at least as large, such that a keyframe is at most max_ratio times larger than its frames.
+    ------------------------------------------------------------
+    :param imsizes: image sizes of the frames
+    :param max_ratio: maximum ratio between the image size of a keyframe and its frames
+    :return: index of the keyframe of every frame
+    """
+    imsizes = np.asarray(imsizes, dtype=float)
+    keys = np.zeros(len(imsizes), dtype=int)
+    key = None
+    for n in np.argsort(-imsizes, kind="stable"):
+        if key is None or imsizes[key] > max_ratio * imsizes[n]:
+            key = n
+        keys[n] = key
+    return keys
 
 
-def fading_effect(source, frames):
-    images = glob("/home/jurjen/Documents/Python/advanced_astro_visualization/frames_high/*")
-    img1 = cv.imread(sorted(images)[-1])
-    img1 = cv.GaussianBlur(img1, (5, 5), 0)
-    img2 = cv.imread(
-        glob(f"/home/jurjen/Documents/Python/advanced_astro_visualization/fits/highres_P205/{source}*MFS-image.png")[0]
+def resample_keyframe(keyframe, key_cutout: tuple, cutout: tuple, frame_size: tuple = (1920, 1080)):
+    """
+    Crop a smaller frame from the centre of a keyframe and scale it to the frame size.
+    ------------------------------------------------------------
+    :param keyframe: RGB keyframe
+    :param key_cutout: cutout size (y, x) in pixels of the keyframe
+    :param cutout: cutout size (y, x) in pixels of the frame
+    :param frame_size: frame size in pixels (width, height)
+    :return: RGB image as uint8 array with shape (height, width, 3)
+    """
+    width, height = frame_size
+    key_height, key_width = keyframe.shape[:2]
+    scale = np.array(
+        [key_width * cutout[1] / (key_cutout[1] * width), key_height * cutout[0] / (key_cutout[0] * height)]
     )
+    # the centres of the frame and the keyframe are the same
+    offset = np.array([key_width, key_height]) / 2 - 0.5 - scale * (np.array(frame_size) / 2 - 0.5)
+    return warp_frame(keyframe, scale, offset, frame_size)
+
 
-    # add extra empty rows to reshape img2
-    add_rows = int((img1.shape[1] / img1.shape[0] * img2.shape[1] - img2.shape[1]) / 2)
-    new = np.zeros((img2.shape[0], img2.shape[1] + add_rows * 2, 3), dtype=np.float32)
-    new[:, add_rows : new.shape[1] - add_rows, :] = img2
-    img2 = new
-    # resize now img2
-    img1 = cv.resize(img1, (img2.shape[1], img2.shape[0]), interpolation=cv.INTER_AREA)  # reshape image
-    for i in np.append(np.linspace(0, 1, frames // 2), np.linspace(0, 1, frames // 2)[::-1]):
-        alpha = i
-        beta = 1 - alpha
-        output = cv.addWeighted(img2, alpha, img1, beta, 0, dtype=cv.CV_32F)
-        output = crop_center(output, int((1 - i / 4) * output.shape[1]), int((1 - i / 4) * output.shape[0]))
-        n = 1
-        if alpha == 1:
-            n = frames // 6
-        for r in range(n):
-            images = glob("/home/jurjen/Documents/Python/advanced_astro_visualization/frames_high/*")
-            new_im_name = f'/home/jurjen/Documents/Python/advanced_astro_visualization/frames_high/image_{str(len(images)).rjust(5, "0")}.png'
-            cv.imwrite(new_im_name, output)
+def canvas_chunks(pix, half, scale, max_pixels: int = CANVAS_PIXELS):
+    """
+    Split a pan in parts of which the canvas is at most max_pixels large.
+    ------------------------------------------------------------
+    :param pix: pixel positions (x, y) of the frames
+    :param half: half the size (x, y) of a frame in pixels
+    :param scale: frame pixels per image pixel (x, y)
+    :param max_pixels: maximum number of pixels of a canvas
+    :return: list of (start, stop) of the frames of each canvas
+    """
+    chunks, start = [], 0
+    low, high = pix[0] - half, pix[0] + half
+    for n in range(1, len(pix)):
+        new_low, new_high = np.minimum(low, pix[n] - half), np.maximum(high, pix[n] + half)
+        if np.prod((new_high - new_low) * scale) > max_pixels:
+            chunks.append((start, n))
+            start, new_low, new_high = n, pix[n] - half, pix[n] + half
+        low, high = new_low, new_high
+    chunks.append((start, len(pix)))
+    return chunks
+
+
+def canvas_window(canvas, canvas_scale, corner, pix, half, frame_size: tuple = (1920, 1080)):
+    """
+    Cut a frame from a canvas at a sub-pixel position. The canvas is rendered like a frame (rows flipped).
+    ------------------------------------------------------------
+    :param canvas: RGB canvas
+    :param canvas_scale: canvas pixels per image pixel (x, y)
+    :param corner: image pixel (x, y) of the lower left corner of the canvas
+    :param pix: image pixel position (x, y) of the centre of the frame
+    :param half: half the size (x, y) of a frame in image pixels
+    :param frame_size: frame size in pixels (width, height)
+    :return: RGB image as uint8 array with shape (height, width, 3)
+    """
+    frame_scale = np.array(frame_size) / (2 * half)
+    scale = canvas_scale / frame_scale
+    # canvas position of the centre of the first frame pixel, from the image position of the frame edge
+    offset = (pix - half - corner + 0.5) * canvas_scale + 0.5 * scale - 0.5
+    offset[1] = canvas.shape[0] - 1 - offset[1] - scale[1] * (frame_size[1] - 1)
+    return warp_frame(canvas, scale, offset, frame_size)
+
+
+def warp_frame(image, scale, offset, frame_size: tuple = (1920, 1080)):
+    """
+    Resample a frame from an image (bilinear, sub-pixel). Frame pixel (x, y) is taken from image position
+    (scale[0] * x + offset[0], scale[1] * y + offset[1]).
+    ------------------------------------------------------------
+    :param image: RGB image
+    :param scale: image pixels per frame pixel (x, y)
+    :param offset: image position of the first frame pixel (x, y)
+    :param frame_size: frame size in pixels (width, height)
+    :return: RGB image as uint8 array with shape (height, width, 3)
+    """
+    matrix = np.array([[scale[0], 0, offset[0]], [0, scale[1], offset[1]]], dtype=float)
+    return cv.warpAffine(
+        image,
+        matrix,
+        tuple(frame_size),
+        flags=cv.INTER_LINEAR | cv.WARP_INVERSE_MAP,
+        borderMode=cv.BORDER_REPLICATE,
+    )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,116 @@
+import json
+import os
+
+from termcolor import colored
+
+from video.scripts.manifest import valid_png
+from video.scripts.writers import FrameDirectory
+
+__all__ = ["FramePlan", "parse_shard"]
+
+
+def parse_shard(shard: str = None):
+    """
+    Parse a shard as 'i/n' (shard i of n shards, counting from 0).
+    ------------------------------------------------------------
+    :param shard: shard text
+    :return: (i, n) or None
+    """
+    if shard is None:
+        return None
+    try:
+        i, n = (int(s) for s in shard.split("/"))
+    except ValueError:
+        raise ValueError(f"Shard should be given as i/n, not '{shard}'.")
+    if n < 1 or not 0 <= i < n:
+        raise ValueError(f"Shard {shard} does not exist, i should be between 0 and {n - 1}.")
+    return i, n
+
+
+class FramePlan:
+    """
+    FramePlan is the compiled path of a movie: the settings of the MovieMaker and the parameters (N, ra, dec, imsize,
+    dpi) of every frame, saved as a JSON file. Shards render their part of the plan into the same frame directory
+    (on a shared filesystem), so a movie can be made by several processes on any number of machines.
+    The frames are divided round-robin over the shards, so every shard gets a part of the slow (wide) frames.
+    """
+
+    def __init__(self, path: str = "plan.json", settings: dict = None, frames: list = None):
+        """
+        :param path: plan file
+        :param settings: keyword arguments for the MovieMaker of the shards
+        :param frames: frame parameters as [N, ra, dec, imsize, dpi]
+        """
+        self.path = path
+        self.settings = settings or {}
+        self.frames = frames or []
+
+    @classmethod
+    def load(cls, path: str = "plan.json"):
+        """
+        Load a saved plan.
+        ------------------------------------------------------------
+        :param path: plan file
+        :return: FramePlan
+        """
+        with open(path) as f:
+            plan = json.load(f)
+        return cls(path=path, settings=plan["settings"], frames=plan["frames"])
+
+    def add(self, frames):
+        """
+        Add frames to the plan.
+        ------------------------------------------------------------
+        :param frames: frame parameters (N, ra, dec, imsize, dpi)
+        """
+        self.frames += [[int(N), float(ra), float(dec), float(imsize), int(dpi)] for N, ra, dec, imsize, dpi in frames]
+        return self
+
+    def save(self):
+        """
+        Save the plan. The file is renamed after writing, so shards never read a half-written plan.
+        """
+        with open(f"{self.path}.tmp", "w") as f:
+            json.dump(dict(settings=self.settings, frames=self.frames), f)
+        os.replace(f"{self.path}.tmp", self.path)
+        return self
+
+    def shard(self, i: int = 0, n: int = 1):
+        """
+        Frames of one shard.
+        ------------------------------------------------------------
+        :param i: shard number (from 0)
+        :param n: number of shards
+        :return: frame parameters of the shard
+        """
+        return self.frames[i::n]
+
+    def missing(self):
+        """
+        Frames of the plan that are not (completely) made.
+        ------------------------------------------------------------
+        :return: frame numbers
+        """
+        frames = FrameDirectory(self.settings["output_file"])
+        return [N for N, *_ in self.frames if not valid_png(frames.frame_name(N))]
+
+    def merge(self):
+        """
+        Check that all frames of the plan are made and record the movie.
+        ------------------------------------------------------------
+        :return: True when the movie is recorded, False when frames are missing
+        """
+        frame_numbers = [N for N, *_ in self.frames]
+        if frame_numbers != list(range(len(frame_numbers))):
+            raise ValueError(f"Frames of plan {self.path} are not numbered from 0 to {len(frame_numbers) - 1}.")
+        missing = self.missing()
+        if missing:
+            print(colored(f"{len(missing)} of {len(self.frames)} frames are missing: {missing}", "red"))
+            return False
+        print(colored(f"All {len(self.frames)} frames are made.", "green"))
+        FrameDirectory(self.settings["output_file"]).record(self.settings["movie_file"], self.settings["framerate"])
+        return True
+
+
+if __name__ == "__main__":
+    print("Cannot call script directly.")
@@ -0,0 +1,84 @@
+import numpy as np
+
+__all__ = ["sky_distances", "route_length", "optimize_route"]
+
+
+def sky_distances(ra, dec):
+    """
+    Distances between all positions on the sky, with RA differences across 0/360 taken the short way round and
+    scaled with cos(dec) (equirectangular approximation, good for the distances within a field).
+    ------------------------------------------------------------
+    :param ra: right ascensions (degrees)
+    :param dec: declinations (degrees)
+    :return: distance matrix (degrees)
+    """
+    ra, dec = np.asarray(ra, dtype=float), np.asarray(dec, dtype=float)
+    d_ra = (ra[:, None] - ra[None, :] + 180) % 360 - 180
+    d_dec = dec[:, None] - dec[None, :]
+    cos_dec = np.cos(np.radians((dec[:, None] + dec[None, :]) / 2))
+    return np.hypot(d_ra * cos_dec, d_dec)
+
+
+def route_length(route, distances):
+    """
+    Length of a closed route.
+    ------------------------------------------------------------
+    :param route: order of the positions
+    :param distances: distance matrix
+    :return: length of the route, back to the first position
+    """
+    route = np.asarray(route)
+    return float(distances[route, np.roll(route, -1)].sum())
+
+
+def optimize_route(ra, dec, start: tuple = None, max_rounds: int = 1000, metric=sky_distances):
+    """
+    Order positions for a short closed route (from start, past all positions and back), with nearest neighbour
+    followed by 2-opt: parts of the route are reversed as long as that makes the route shorter.
+    When that is not shorter than the positions in the given order, the given order is kept.
+    ------------------------------------------------------------
+    :param ra: right ascensions (degrees)
+    :param dec: declinations (degrees)
+    :param start: (ra, dec) where the route starts and ends (default: the first position)
+    :param max_rounds: maximum number of improvements by 2-opt
+    :param metric: function (ra, dec) to the distance matrix of the positions, like sky_distances
+    :return: order of the positions (indices of ra and dec)
+    """
+    ra, dec = np.asarray(ra, dtype=float), np.asarray(dec, dtype=float)
+    if start is not None:
+        ra, dec = np.append(start[0], ra), np.append(start[1], dec)
+    distances = np.asarray(metric(ra, dec), dtype=float)
+    n = len(ra)
+
+    # nearest neighbour from the start
+    route, unvisited = [0], np.ones(n, dtype=bool)
+    unvisited[0] = False
+    for _ in range(n - 1):
+        candidates = np.flatnonzero(unvisited)
+        route.append(candidates[np.argmin(distances[route[-1], candidates])])
+        unvisited[route[-1]] = False
+    route = np.array(route)
+
+    # 2-opt, with the start fixed at the beginning; for every i all j are tried at once
+    for _ in range(max_rounds):
+        improved = False
+        for i in range(1, n - 1):
+            j = np.arange(i + 1, n)
+            a, b, c, d = route[i - 1], route[i], route[j], route[(j + 1) % n]
+            gain = distances[a, b] + distances[c, d] - distances[a, c] - distances[b, d]
+            best = np.argmax(gain)
+            if gain[best] > 1e-12:
+                route[i : j[best] + 1] = route[i : j[best] + 1][::-1]
+                improved = True
+        if not improved:
+            break
+    if route_length(route, distances) >= route_length(np.arange(n), distances):
+        route = np.arange(n)
+
+    if start is not None:
+        return route[1:] - 1
+    return route
+
+
+if __name__ == "__main__":
+    print("Cannot call script directly.")
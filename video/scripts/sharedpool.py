@@ -0,0 +1,54 @@
+import traceback
+
+from poster.scripts.sharedpool import MappedImage, SharedImage, share
+
+__all__ = ["SharedImage", "MappedImage", "share", "init_worker", "make_frame_worker", "render_frame_worker"]
+
+_movie = None  # MovieMaker instance of the current worker process
+
+
+def init_worker(movie):
+    """
+    Initialize a worker process with one MovieMaker, reading the image from shared memory.
+    ------------------------------------------------------------
+    :param movie: MovieMaker instance
+    """
+    global _movie
+    _movie = movie
+    _movie.timer.as_worker()
+    _movie.attach_shared()
+
+
+def make_frame_worker(inputs):
+    """
+    Make one frame in a worker process.
+    ------------------------------------------------------------
+    :param inputs: frame inputs (N, ra, dec, imsize, dpi, pix)
+    :return: frame number, traceback if the frame failed (otherwise None) and the timing of the frame
+    """
+    try:
+        _movie.make_frame(*inputs)
+    except Exception:
+        return inputs[0], traceback.format_exc(), _movie.timer.last()
+    return inputs[0], None, _movie.timer.last()
+
+
+def render_frame_worker(ra, dec, imsize, pix=None, N=None):
+    """
+    Render one frame in a worker process to an RGB buffer.
+    ------------------------------------------------------------
+    :param ra: right ascension (degrees)
+    :param dec: declination (degrees)
+    :param imsize: image size (degree size)
+    :param pix: pixel position of (ra, dec)
+    :param N: frame number
+    :return: RGB image, traceback if the frame failed (otherwise None) and the timing of the frame
+    """
+    try:
+        return _movie.render_frame(ra=ra, dec=dec, imsize=imsize, pix=pix, N=N), None, _movie.timer.last()
+    except Exception:
+        return None, traceback.format_exc(), _movie.timer.last()
+
+
+if __name__ == "__main__":
+    print("Cannot call script directly.")
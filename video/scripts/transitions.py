@@ -0,0 +1,69 @@
+import cv2 as cv
+import numpy as np
+
+__all__ = ["EFFECTS", "read_image", "fit_frame", "transition_frame"]
+
+EFFECTS = ["crossfade", "zoom"]
+
+
+def read_image(image):
+    """
+    Read an image as RGB.
+    ------------------------------------------------------------
+    :param image: image file or RGB image
+    :return: RGB image as uint8 array
+    """
+    if isinstance(image, str):
+        data = cv.imread(image)
+        if data is None:
+            raise FileNotFoundError(f"Can not read image {image}")
+        return cv.cvtColor(data, cv.COLOR_BGR2RGB)
+    return np.ascontiguousarray(image, dtype=np.uint8)
+
+
+def fit_frame(image, frame_size: tuple = (1920, 1080)):
+    """
+    Fit an image in a frame, with black borders when the aspect ratio is different.
+    ------------------------------------------------------------
+    :param image: RGB image
+    :param frame_size: frame size in pixels (width, height)
+    :return: RGB image as uint8 array with shape (height, width, 3)
+    """
+    width, height = frame_size
+    if image.shape[:2] == (height, width):
+        return image
+    scale = min(width / image.shape[1], height / image.shape[0])
+    size = (max(int(round(image.shape[1] * scale)), 1), max(int(round(image.shape[0] * scale)), 1))
+    resized = cv.resize(image, size, interpolation=cv.INTER_AREA if scale < 1 else cv.INTER_LINEAR)
+    frame = np.zeros((height, width, 3), dtype=np.uint8)
+    top, left = (height - size[1]) // 2, (width - size[0]) // 2
+    frame[top : top + size[1], left : left + size[0]] = resized
+    return frame
+
+
+def transition_frame(start, end, alpha: float = 0.5, effect: str = "crossfade"):
+    """
+    Frame of a transition between two frames of the same size.
+    With the zoom effect, the blend also zooms into the centre, to 4/3 times at the end of the transition.
+    ------------------------------------------------------------
+    :param start: RGB frame at the start of the transition
+    :param end: RGB frame at the end of the transition
+    :param alpha: progress of the transition (0 is the start, 1 is the end)
+    :param effect: transition effect [crossfade, zoom]
+    :return: RGB image as uint8 array
+    """
+    if effect not in EFFECTS:
+        raise ValueError(f"Transition effect should be one of {EFFECTS}, not '{effect}'.")
+    image = cv.addWeighted(end, alpha, start, 1 - alpha, 0)
+    if effect == "zoom" and alpha > 0:  # crop and resize, which is much faster than a warp
+        height, width = image.shape[:2]
+        crop_width, crop_height = int(round(width * (1 - alpha / 4))), int(round(height * (1 - alpha / 4)))
+        left, top = (width - crop_width) // 2, (height - crop_height) // 2
+        image = cv.resize(
+            image[top : top + crop_height, left : left + crop_width], (width, height), interpolation=cv.INTER_LINEAR
+        )
+    return image
+
+
+if __name__ == "__main__":
+    print("Cannot call script directly.")
@@ -0,0 +1,184 @@
+import os
+import shutil
+import subprocess
+
+import cv2 as cv
+
+__all__ = ["FrameDirectory", "FFmpegStream"]
+
+
+class FrameDirectory:
+    """
+    FrameDirectory writes RGB frames as numbered png images in a directory, to record them later with ffmpeg.
+    """
+
+    def __init__(self, directory: str = "frames"):
+        """
+        :param directory: directory for the frames
+        """
+        self.directory = directory
+        os.makedirs(self.directory, exist_ok=True)
+
+    def frame_name(self, N):
+        """
+        File name of a frame.
+        ------------------------------------------------------------
+        :param N: frame number
+        :return: path of the frame
+        """
+        return f'{self.directory}/image_{str(N).rjust(5, "0")}.png'
+
+    def temp_name(self, N):
+        """
+        Temporary file name of a frame, which is renamed when the frame is complete.
+        ------------------------------------------------------------
+        :param N: frame number
+        :return: path of the temporary frame
+        """
+        return f'{self.directory}/tmp_image_{str(N).rjust(5, "0")}.png'
+
+    def write(self, N, image):
+        """
+        Write one frame. The frame is renamed after writing, so a crash never leaves a half-written frame.
+        ------------------------------------------------------------
+        :param N: frame number
+        :param image: RGB image as uint8 array
+        """
+        cv.imwrite(self.temp_name(N), cv.cvtColor(image, cv.COLOR_RGB2BGR))
+        os.replace(self.temp_name(N), self.frame_name(N))
+        return self
+
+    def hold(self, N, frames: int = 1):
+        """
+        Show frame N longer, as the next frames. The frame is linked (or copied), not encoded again.
+        ------------------------------------------------------------
+        :param N: frame number
+        :param frames: number of extra frames
+        """
+        for M in range(N + 1, N + 1 + frames):
+            try:
+                os.link(self.frame_name(N), self.temp_name(M))
+            except OSError:  # file systems without hard links
+                shutil.copyfile(self.frame_name(N), self.temp_name(M))
+            os.replace(self.temp_name(M), self.frame_name(M))
+        return self
+
+    def record(self, movie_file: str = "movie.mp4", framerate: float = 20):
+        """
+        Record the frames into a movie with ffmpeg.
+        ------------------------------------------------------------
+        :param movie_file: output movie
+        :param framerate: frame rate
+        """
+        os.system(
+            f"rm {movie_file}; ffmpeg -f image2 -r {framerate} -start_number 0 "
+            f"-i {self.directory}/image_%05d.png {movie_file}"
+        )
+        return self
+
+    def close(self):
+        return self
+
+
+class FFmpegStream:
+    """
+    FFmpegStream pipes raw RGB frames into one long-running ffmpeg process, so no frames are written to disk.
+    Frames have to be written in order. Writing blocks when ffmpeg can not keep up (back-pressure).
+    """
+
+    def __init__(
+        self,
+        movie_file: str = "movie.mp4",
+        framerate: float = 20,
+        frame_size: tuple = (1920, 1080),
+        ffmpeg: str = "ffmpeg",
+    ):
+        """
+        :param movie_file: output movie
+        :param framerate: frame rate
+        :param frame_size: frame size in pixels (width, height)
+        :param ffmpeg: ffmpeg executable
+        """
+        self.movie_file = movie_file
+        self.framerate = framerate
+        self.frame_size = frame_size
+        self.ffmpeg = ffmpeg
+        self.process = None
+        self.count = 0
+        self.last = None
+
+    def open(self):
+        """
+        Start ffmpeg, reading rawvideo from stdin.
+        """
+        width, height = self.frame_size
+        self.process = subprocess.Popen(
+            [
+                self.ffmpeg,
+                "-y",
+                "-loglevel",
+                "error",
+                "-f",
+                "rawvideo",
+                "-pix_fmt",
+                "rgb24",
+                "-s",
+                f"{width}x{height}",
+                "-r",
+                str(self.framerate),
+                "-i",
+                "-",
+                "-pix_fmt",
+                "yuv420p",
+                self.movie_file,
+            ],
+            stdin=subprocess.PIPE,
+        )
+        return self
+
+    def write(self, N, image):
+        """
+        Write one frame to ffmpeg.
+        ------------------------------------------------------------
+        :param N: frame number (should be the next frame)
+        :param image: RGB image as uint8 array with shape (height, width, 3)
+        """
+        if N != self.count:
+            raise ValueError(f"Frame {N} is written out of order, expected frame {self.count}.")
+        if image.shape != (self.frame_size[1], self.frame_size[0], 3):
+            raise ValueError(f"Frame {N} has shape {image.shape}, but the stream has frame size {self.frame_size}.")
+        if self.process is None:
+            self.open()
+        self.last = image.tobytes()
+        self.process.stdin.write(self.last)
+        self.count += 1
+        return self
+
+    def hold(self, N, frames: int = 1):
+        """
+        Show the last frame longer, as the next frames. The raw frame is written again, nothing is rendered.
+        ------------------------------------------------------------
+        :param N: frame number (should be the last written frame)
+        :param frames: number of extra frames
+        """
+        if N != self.count - 1:
+            raise ValueError(f"Only the last frame ({self.count - 1}) can be held, not frame {N}.")
+        for _ in range(frames):
+            self.process.stdin.write(self.last)
+        self.count += frames
+        return self
+
+    def close(self):
+        """
+        Close the stream and wait until ffmpeg has finished the movie.
+        """
+        if self.process is not None:
+            self.process.stdin.close()
+            if self.process.wait() != 0:
+                raise RuntimeError(f"ffmpeg exited with code {self.process.returncode}")
+            self.process = None
+        return self
+
+
+if __name__ == "__main__":
+    print("Cannot call script directly.")